@@ -34,6 +34,15 @@ DEBUG = os.environ.get('DEBUG', '0') == '1'
 ALLOWED_HOSTS = os.getenv('DJANGO_ALLOWED_HOSTS', 'localhost').split(',')
 
 RIOT_API_KEY = os.getenv('RIOT_API_KEY')
+RIOT_API_CONCURRENCY = int(os.getenv('RIOT_API_CONCURRENCY', '100'))
+# Riot application limits as "count:seconds" windows; the defaults match a development key.
+RIOT_APP_RATE_LIMITS = os.getenv('RIOT_APP_RATE_LIMITS', '20:1,100:120')
+# Share of every rate-limit bucket that backfills leave for interactive lookups.
+RIOT_BACKFILL_RESERVE = float(os.getenv('RIOT_BACKFILL_RESERVE', '0.2'))
+# "redis" shares the rate-limit buckets across processes, "local" keeps them in-process.
+RIOT_RATE_LIMIT_STORE = os.getenv('RIOT_RATE_LIMIT_STORE', 'redis')
+# Number of 20-match batches fetched ahead of the one being written to the database.
+MATCH_PIPELINE_DEPTH = int(os.getenv('MATCH_PIPELINE_DEPTH', '2'))
 
 CSRF_TRUSTED_ORIGINS = ["https://aram-go.com", "https://www.aram-go.com"]
 SESSION_COOKIE_SECURE = True
@@ -153,12 +162,33 @@ INTERNAL_IPS = [
 LIVERELOAD_HOST = '0.0.0.0'
 
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
-CELERY_RESULT_BACKEND = os.getenv('CELERY_BACKEND_URL')
+# The compose files pass CELERY_RESULT_BACKEND; chords and celery-progress both need a result backend.
+CELERY_RESULT_BACKEND = os.getenv('CELERY_BACKEND_URL', os.getenv('CELERY_RESULT_BACKEND'))
 
 
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
-CELERY_WORKER_CONCURRENCY = 1
+CELERY_WORKER_CONCURRENCY = int(os.getenv('CELERY_WORKER_CONCURRENCY', '1'))
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# "Update" clicks go to their own queue and workers so they never wait behind multi-thousand-match backfills.
+CELERY_TASK_DEFAULT_QUEUE = 'backfill'
+CELERY_TASK_ROUTES = {
+    'match_history.tasks.update_matches': {'queue': 'interactive'},
+    'match_history.tasks.process_matches': {'queue': 'backfill'},
+    'match_history.tasks.process_match_chunk': {'queue': 'backfill'},
+    'match_history.tasks.finish_backfill': {'queue': 'backfill'},
+}
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+MAX_CONCURRENT_BACKFILLS = int(os.getenv('MAX_CONCURRENT_BACKFILLS', '4'))
+# Players the crawl command backfills at once, and how long before a crawled player is due again.
+CRAWLER_CONCURRENCY = int(os.getenv('CRAWLER_CONCURRENCY', '4'))
+CRAWLER_REVISIT_HOURS = float(os.getenv('CRAWLER_REVISIT_HOURS', '24'))
 
 # Cache
 CACHES = {
@@ -1,6 +1,6 @@
 from django.apps import AppConfig
 from AramGoV2.util.current_patch import get_patch
-from django.core.cache import cache
+from match_history.util.patch_provider import publish_patch
 
 
 class MatchHistoryConfig(AppConfig):
@@ -12,7 +12,7 @@ class MatchHistoryConfig(AppConfig):
         if patch:
             # Increased cache timeout from 7 days (604800 seconds) to 30 days (2592000 seconds)
             # to ensure patch version is cached for longer as requested
-            cache.set('PATCH', patch, timeout=2592000)
+            publish_patch(patch, timeout=2592000)
             print(f"{patch} cache successfully")
         else:
             print("Patch could not be retrieved")
@@ -0,0 +1,52 @@
+import time
+from multiprocessing import cpu_count
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from match_history.models import Match, Participant
+from match_history.util.batch_jobs import iter_chunks, run_in_pool
+from match_history.util.match_cards import write_cards
+from match_history.util.profile_snapshot import bump_profile_epoch
+
+# Everything write_cards reads from a participant, so a chunk is built from a single query.
+CARD_RELATIONS = ["match", "summoner", "champion", "spell1", "spell2", "rune1", "rune2",
+                  "item1", "item2", "item3", "item4", "item5", "item6"]
+
+
+def iter_match_chunks(chunk_size=200, missing_only=True):
+    """Yields match ids in lists of chunk_size, in primary key order; only matches without a card if missing_only."""
+    matches = Match.objects.order_by("match_id")
+    if missing_only:
+        matches = matches.filter(card__isnull=True)
+    return iter_chunks(matches.values_list("match_id", flat=True), chunk_size)
+
+
+def build_chunk(match_ids):
+    """Writes the MatchCard and ParticipantCards of every match in match_ids from its Participant and asset rows."""
+    participants = Participant.objects.filter(match_id__in=match_ids).select_related(*CARD_RELATIONS)
+    with transaction.atomic():
+        write_cards(participants)
+    return len(match_ids)
+
+
+class Command(BaseCommand):
+    help = ('Builds MatchCard and ParticipantCard rows from existing Match and Participant rows, for matches '
+            'ingested before match cards existed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument('--all', action='store_true', help='rewrite the cards of matches that already have one')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Building match cards with {options['workers']} workers...")
+        start = time.time()
+        built = 0
+        chunks = iter_match_chunks(options['chunk_size'], missing_only=not options['all'])
+        for count in run_in_pool(build_chunk, chunks, options['workers']):
+            built += count
+            self.stdout.write(f"{built} matches carded")
+        # Cached profiles were built without these cards.
+        bump_profile_epoch()
+        self.stdout.write(self.style.SUCCESS(f"Built cards for {built} matches in {time.time() - start:.1f}s"))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from match_history.models import Summoner
+from match_history.util.crawler import Crawler
+from match_history.util.frontier import Frontier
+
+
+class Command(BaseCommand):
+    help = 'Crawls the match histories of players discovered in ingested matches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Players crawled at once (default: CRAWLER_CONCURRENCY)')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many players')
+        parser.add_argument('--seed', action='store_true',
+                            help='Add every known summoner to the frontier before crawling')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            Frontier().discover(Summoner.objects.values_list('puuid', flat=True))
+        start = time.monotonic()
+        crawled = Crawler("americas", "na1", concurrency=options['concurrency']).run(limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Crawled {crawled} players in {time.monotonic() - start:.1f}s'))
@@ -0,0 +1,67 @@
+import gzip
+import json
+import time
+from multiprocessing import cpu_count
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from match_history.util.batch_jobs import iter_chunks, run_in_pool
+from match_history.util.populate_data import MatchManager
+
+SUFFIXES = (".json", ".jsonl", ".json.gz", ".jsonl.gz")
+
+
+def _open(path: Path):
+    if path.name.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_documents(directory: Path):
+    """Yields the raw JSON text of every match-v5 document in the dump: one per line for JSONL, one per file otherwise."""
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or not path.name.endswith(SUFFIXES):
+            continue
+        with _open(path) as dump:
+            if ".jsonl" in path.name:
+                for line in dump:
+                    if line.strip():
+                        yield line
+            else:
+                yield dump.read()
+
+
+def ingest_chunk(documents):
+    """Parses a chunk of raw documents and persists it through MatchManager. A .json file may hold a list of matches."""
+    match_data = {}
+    for document in documents:
+        parsed = json.loads(document)
+        for match_info in parsed if isinstance(parsed, list) else [parsed]:
+            match_data[match_info["metadata"]["matchId"]] = match_info
+    MatchManager("americas", "na1", None)._persist_batch(match_data)
+    return len(match_data)
+
+
+class Command(BaseCommand):
+    help = 'Ingests a directory of match-v5 JSON/JSONL(.gz) payloads without calling the Riot API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', type=Path)
+        parser.add_argument('--workers', type=int, default=cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not directory.is_dir():
+            raise CommandError(f"{directory} is not a directory")
+
+        self.stdout.write(f"Ingesting {directory} with {options['workers']} workers...")
+        start = time.time()
+        ingested = 0
+        chunks = iter_chunks(iter_documents(directory), options['chunk_size'])
+        for count in run_in_pool(ingest_chunk, chunks, options['workers']):
+            ingested += count
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {ingested} matches in {elapsed:.1f}s ({ingested / elapsed if elapsed else 0:.1f} matches/sec)"))
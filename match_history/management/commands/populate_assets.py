@@ -3,6 +3,8 @@ import requests
 from django.core.cache import cache
 from django.core.management.base import BaseCommand
 from match_history.models import Champion, Item, ProfileIcon, SummonerSpell, Rune
+from match_history.util.asset_cache import bump_asset_version
+from match_history.util.patch_provider import publish_patch
 
 patch = cache.get("PATCH")
 
@@ -43,6 +45,8 @@ class Command(BaseCommand):
         self.populate_profileicon(profile_data)
         self.populate_spells(spell_data)
         self.populate_runes(runes_data)
+        bump_asset_version()
+        publish_patch(patch, timeout=2592000)
 
     def populate_champions(self, champion_data: dict):
         print("Populating champions")
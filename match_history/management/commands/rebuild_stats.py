@@ -0,0 +1,174 @@
+import time
+from multiprocessing import cpu_count
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, DateField, F, Max, Q, Sum, Value
+from django.db.models.functions import TruncMonth
+
+from match_history.models import Match, Participant, Summoner, SummonerChampionStats, AccountStats, \
+    ChampionStatsPatch, TeammateStats
+from match_history.util.batch_jobs import run_in_pool
+from match_history.util.profile_snapshot import bump_profile_epoch
+from match_history.util.tier_list import bump_champion_stats_version
+
+CHAMPION_AGGREGATES = {
+    "total_played": Count("id"),
+    "duration_played": Sum("match__game_duration"),
+    "total_creep_score": Sum("creep_score"),
+    "total_wins": Count("id", filter=Q(win=True)),
+    "total_losses": Count("id", filter=Q(win=False)),
+    "total_kills": Sum("kills"),
+    "total_deaths": Sum("deaths"),
+    "total_assists": Sum("assists"),
+}
+ACCOUNT_AGGREGATES = {
+    "total_played": Count("id"),
+    "total_wins": Count("id", filter=Q(win=True)),
+    "total_losses": Count("id", filter=Q(win=False)),
+    "total_kills": Sum("kills"),
+    "total_deaths": Sum("deaths"),
+    "total_assists": Sum("assists"),
+    "snowballs_thrown": Sum("snowballs_thrown"),
+    "snowball_hits": Sum("snowball_hits"),
+}
+PATCH_AGGREGATES = {
+    "total_played": Count("id"),
+    "total_wins": Count("id", filter=Q(win=True)),
+    "total_losses": Count("id", filter=Q(win=False)),
+}
+TEAMMATE_AGGREGATES = {
+    "games": Count("id"),
+    "wins": Count("id", filter=Q(win=True)),
+    "last_played": Max("match__game_start"),
+}
+
+
+def _summoner_range(queryset, low, high):
+    if low is not None:
+        queryset = queryset.filter(summoner_id__gte=low)
+    if high is not None:
+        queryset = queryset.filter(summoner_id__lt=high)
+    return queryset
+
+
+def _replace(model, existing, rows):
+    """
+    Replaces the `existing` rows of model with `rows`, a values().annotate() queryset whose names are model fields,
+    by a DELETE and an INSERT ... SELECT in one transaction. Ingestion can keep running: a batch that committed before
+    the INSERT is part of its aggregates, and a later batch's upserts wait on the locks of the rows we delete
+    or insert and then apply to the new rows. Rows a batch creates in between are overwritten with the aggregates,
+    which already include that batch. Returns the number of rows written.
+    """
+    quote = connection.ops.quote_name
+    select, params = rows.query.sql_with_params()
+    names = list(rows.query.values_select) + list(rows.query.annotation_select)
+    columns = [quote(model._meta.get_field(name).column) for name in names]
+    conflict = [quote(model._meta.get_field(name).column) for name in model._meta.unique_together[0]]
+    updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column not in conflict)
+    with transaction.atomic():
+        existing.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(columns)}) {select} "
+                           f"ON CONFLICT ({', '.join(conflict)}) DO UPDATE SET {updates}", params)
+            return cursor.rowcount
+
+
+def rebuild_summoner_partition(partition):
+    """Recomputes SummonerChampionStats and AccountStats for one year and puuid range."""
+    year, low, high = partition
+    participants = _summoner_range(Participant.objects.filter(match__game_start__year=year), low, high)
+    rows = _replace(SummonerChampionStats,
+                    _summoner_range(SummonerChampionStats.objects.filter(year=year), low, high),
+                    participants.values("summoner_id", "champion_id").annotate(year=Value(year), **CHAMPION_AGGREGATES))
+    rows += _replace(AccountStats,
+                     _summoner_range(AccountStats.objects.filter(year=year), low, high),
+                     participants.values("summoner_id").annotate(year=Value(year), **ACCOUNT_AGGREGATES))
+    return rows
+
+
+def rebuild_teammate_partition(partition):
+    """
+    Recomputes TeammateStats for one year and puuid range by joining every participant to the other players on their
+    team in the same match. Months are taken in TIME_ZONE, like the game_start dates ingestion counts them by.
+    """
+    year, low, high = partition
+    participants = _summoner_range(Participant.objects.filter(match__game_start__year=year), low, high)
+    pairs = (participants.filter(match__participants__team=F("team"))
+             .annotate(teammate_id=F("match__participants__summoner_id"),
+                       month=TruncMonth("match__game_start", output_field=DateField()))
+             .exclude(teammate_id=F("summoner_id")))
+    return _replace(TeammateStats,
+                    _summoner_range(TeammateStats.objects.filter(month__year=year), low, high),
+                    pairs.values("summoner_id", "teammate_id", "month").annotate(**TEAMMATE_AGGREGATES))
+
+
+def rebuild_patch_partition(partition):
+    """Recomputes ChampionStatsPatch for one patch from every game version that belongs to it."""
+    patch, game_versions = partition
+    participants = Participant.objects.filter(match__game_version__in=game_versions)
+    return _replace(ChampionStatsPatch, ChampionStatsPatch.objects.filter(patch=patch),
+                    participants.values("champion_id").annotate(patch=Value(patch), **PATCH_AGGREGATES))
+
+
+def _rebuild(partition):
+    kind, key = partition
+    if kind == "summoner":
+        return rebuild_summoner_partition(key)
+    if kind == "teammate":
+        return rebuild_teammate_partition(key)
+    return rebuild_patch_partition(key)
+
+
+def summoner_bounds(partitions):
+    """Splits the puuid space into roughly equal [low, high) ranges; None means unbounded."""
+    total = Summoner.objects.count()
+    if partitions <= 1 or total < partitions:
+        return [(None, None)]
+    puuids = Summoner.objects.order_by("puuid").values_list("puuid", flat=True)
+    cuts = sorted({puuids[total * i // partitions] for i in range(1, partitions)})
+    bounds = [None] + cuts + [None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def patch_versions():
+    """Maps every patch (e.g. "14.17") to the full game versions recorded for it."""
+    versions = {}
+    for game_version in Match.objects.order_by().values_list("game_version", flat=True).distinct():
+        patch = ".".join(game_version.split(".")[:2])
+        versions.setdefault(patch, []).append(game_version)
+    return versions
+
+
+class Command(BaseCommand):
+    help = ('Recomputes SummonerChampionStats, AccountStats, TeammateStats and ChampionStatsPatch from Participant '
+            'rows. Also backfills TeammateStats for matches ingested before it existed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=cpu_count())
+        parser.add_argument('--summoner-partitions', type=int, default=16,
+                            help='puuid ranges per year for the per-summoner tables')
+        parser.add_argument('--skip-summoners', action='store_true')
+        parser.add_argument('--skip-teammates', action='store_true')
+        parser.add_argument('--skip-patches', action='store_true')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        partitions = []
+        years = [date.year for date in Match.objects.dates('game_start', 'year')]
+        bounds = summoner_bounds(options['summoner_partitions'])
+        if not options['skip_summoners']:
+            partitions += [("summoner", (year, low, high)) for year in years for low, high in bounds]
+        if not options['skip_teammates']:
+            partitions += [("teammate", (year, low, high)) for year in years for low, high in bounds]
+        if not options['skip_patches']:
+            partitions += [("patch", item) for item in patch_versions().items()]
+
+        self.stdout.write(f"Rebuilding stats in {len(partitions)} partitions with {options['workers']} workers...")
+        rows = 0
+        for count in run_in_pool(_rebuild, partitions, options['workers']):
+            rows += count
+        # Cached profiles and their ETags were built from the old rows.
+        bump_profile_epoch()
+        bump_champion_stats_version()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} stat rows in {time.time() - start:.1f}s"))
@@ -0,0 +1,40 @@
+import time
+from multiprocessing import cpu_count
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from match_history.util.batch_jobs import run_in_pool
+from match_history.util.match_archive import iter_match_id_chunks, load_matches
+from match_history.util.populate_data import MatchManager
+
+
+def _reprocess_chunk(match_ids):
+    # Every archived match is already in the database, so _persist_batch rewrites its rows but adds no stat deltas.
+    match_data = load_matches(match_ids)
+    MatchManager("americas", "na1", None)._persist_batch(match_data, archive=False)
+    return len(match_data)
+
+
+class Command(BaseCommand):
+    help = ('Re-derives Match and Participant rows from the raw match archive without calling the Riot API, then '
+            'runs rebuild_stats so the stat tables reflect the rewritten rows')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument('--skip-rebuild-stats', action='store_true',
+                            help='leave the stat tables as they are; run rebuild_stats yourself afterwards')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Reprocessing archived matches with {options['workers']} workers...")
+        start = time.time()
+        processed = 0
+        for count in run_in_pool(_reprocess_chunk, iter_match_id_chunks(options['chunk_size']), options['workers']):
+            processed += count
+            self.stdout.write(f"{processed} matches reprocessed")
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Reprocessed {processed} matches in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.1f} matches/sec)"))
+        if not options['skip_rebuild_stats']:
+            call_command('rebuild_stats', workers=options['workers'], stdout=self.stdout)
@@ -6,6 +6,8 @@ from django.urls import reverse
 from django import template
 from django.core.cache import cache
 
+from match_history.util.patch_provider import patch_provider
+
 
 class Champion(models.Model):
     champion_id = models.CharField(primary_key=True, max_length=100)
@@ -14,9 +16,12 @@ class Champion(models.Model):
     image_path = models.CharField(max_length=100)
     splash_image_path = models.CharField(max_length=100)
 
+    @staticmethod
+    def url_for(image_path, patch):
+        return f"https://ddragon.leagueoflegends.com/cdn/{patch}/img/champion/{image_path}"
+
     def get_url(self):
-        patch = cache.get("PATCH")
-        return f"https://ddragon.leagueoflegends.com/cdn/{patch}/img/champion/{self.image_path}"
+        return Champion.url_for(self.image_path, patch_provider.current())
 
     def get_splash_url(self):
         return f"https://ddragon.leagueoflegends.com/cdn/img/champion/splash/{self.splash_image_path}"
@@ -30,9 +35,12 @@ class Item(models.Model):
     name = models.CharField(max_length=255)
     image_path = models.CharField(max_length=255)
 
+    @staticmethod
+    def url_for(image_path, patch):
+        return f"https://ddragon.leagueoflegends.com/cdn/{patch}/img/item/{image_path}"
+
     def get_url(self):
-        patch = cache.get("PATCH")
-        return f"https://ddragon.leagueoflegends.com/cdn/{patch}/img/item/{self.image_path}"
+        return Item.url_for(self.image_path, patch_provider.current())
 
     def __str__(self):
         return self.name
@@ -42,11 +50,12 @@ class ProfileIcon(models.Model):
     profile_id = models.CharField(primary_key=True, max_length=100)
     image_path = models.CharField(max_length=100)
 
+    @staticmethod
+    def url_for(image_path, patch):
+        return f"https://ddragon.leagueoflegends.com/cdn/{patch}/img/profileicon/{image_path}"
+
     def get_url(self):
-        patch = cache.get("PATCH")
-        print("here")
-        print(patch)
-        return f"https://ddragon.leagueoflegends.com/cdn/{patch}/img/profileicon/{self.image_path}"
+        return ProfileIcon.url_for(self.image_path, patch_provider.current())
 
     def __str__(self):
         return self.profile_id
@@ -57,9 +66,12 @@ class SummonerSpell(models.Model):
     name = models.CharField(max_length=100)
     image_path = models.CharField(max_length=100)
 
+    @staticmethod
+    def url_for(image_path, patch):
+        return f"https://ddragon.leagueoflegends.com/cdn/{patch}/img/spell/{image_path}"
+
     def get_url(self):
-        patch = cache.get("PATCH")
-        return f"https://ddragon.leagueoflegends.com/cdn/{patch}/img/spell/{self.image_path}"
+        return SummonerSpell.url_for(self.image_path, patch_provider.current())
 
     def __str__(self):
         return f"{self.name} {self.spell_id}"
@@ -70,8 +82,12 @@ class Rune(models.Model):
     name = models.CharField(max_length=100)
     image_path = models.CharField(max_length=100)
 
+    @staticmethod
+    def url_for(image_path, patch=None):
+        return f"https://ddragon.leagueoflegends.com/cdn/img/{image_path}"
+
     def get_url(self):
-        return f"https://ddragon.leagueoflegends.com/cdn/img/{self.image_path}"
+        return Rune.url_for(self.image_path)
 
 
 class Summoner(models.Model):
@@ -88,6 +104,9 @@ class Summoner(models.Model):
     being_parsed = models.BooleanField(default=False)
     parsed_matches = models.IntegerField(default=False)
     total_matches = models.IntegerField(default=0)
+    # Sync cursor: newest match of this summoner already ingested, so refreshes only page through newer games.
+    last_match_id = models.CharField(max_length=30, blank=True, null=True)
+    last_match_start = models.DateTimeField(blank=True, null=True)
 
     def get_matches_queryset(self):
         return Match.objects.filter(participants__summoner=self)
@@ -104,6 +123,34 @@ class Summoner(models.Model):
         return f"Summoner:{self.game_name} {self.puuid}"
 
 
+def format_duration(game_duration):
+    minutes = game_duration // 60
+    seconds = game_duration % 60
+    return f"{minutes}:{seconds}"
+
+
+def format_time_diff(game_start):
+    la_timezone = pytz.timezone('America/Los_Angeles')
+
+    now = timezone.now().astimezone(la_timezone)
+    game_start_la = game_start.astimezone(la_timezone)
+
+    difference = now - game_start_la
+    seconds = difference.total_seconds()
+    minutes = seconds // 60
+    hours = seconds // 3600
+    days = seconds // 86400
+
+    if minutes < 60:
+        return f"{int(minutes)} minutes ago"
+    elif hours < 24:
+        return f"{int(hours)} hours ago"
+    elif days < 30:
+        return f"{int(days)} days ago"
+    else:
+        return game_start.strftime('%m-%d-%Y')
+
+
 class Match(models.Model):
     BLUE_TEAM = 100
     RED_TEAM = 200
@@ -125,9 +172,7 @@ class Match(models.Model):
         return '.'.join(self.game_version.split('.')[:2])
 
     def get_duration(self):
-        minutes = self.game_duration // 60
-        seconds = self.game_duration % 60
-        return f"{minutes}:{seconds}"
+        return format_duration(self.game_duration)
 
     def get_minutes(self):
         return self.game_duration // 60
@@ -136,31 +181,39 @@ class Match(models.Model):
         return self.participants.select_related("match").all()
 
     def get_time_diff(self):
-        la_timezone = pytz.timezone('America/Los_Angeles')
-
-        now = timezone.now().astimezone(la_timezone)
-        game_start_la = self.game_start.astimezone(la_timezone)
-
-        difference = now - game_start_la
-        seconds = difference.total_seconds()
-        minutes = seconds // 60
-        hours = seconds // 3600
-        days = seconds // 86400
-
-        if minutes < 60:
-            return f"{int(minutes)} minutes ago"
-        elif hours < 24:
-            return f"{int(hours)} hours ago"
-        elif days < 30:
-            return f"{int(days)} days ago"
-        else:
-            return self.game_start.strftime('%m-%d-%Y')
+        return format_time_diff(self.game_start)
 
     def __str__(self):
         return self.match_id
 
     class Meta:
         ordering = ['-game_start']
+        indexes = [models.Index(fields=['-game_start', '-match_id'])]
+
+
+class RawMatch(models.Model):
+    """gzip-compressed match-v5 payload, kept so rows can be re-derived without refetching from Riot."""
+    match_id = models.CharField(primary_key=True, max_length=30)
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.match_id
+
+
+class CrawlFrontier(models.Model):
+    """A player discovered in ingested matches, waiting to have their own match history crawled."""
+    puuid = models.CharField(primary_key=True, max_length=100)
+    games_seen = models.IntegerField(default=0)
+    discovered_at = models.DateTimeField(auto_now_add=True)
+    last_crawled = models.DateTimeField(blank=True, null=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return self.puuid
+
+    class Meta:
+        indexes = [models.Index(fields=['last_crawled', '-games_seen'])]
 
 
 class Participant(models.Model):
@@ -193,6 +246,11 @@ class Participant(models.Model):
     team = models.IntegerField(choices=TEAM_CHOICES)
     win = models.BooleanField()
     game_name = models.CharField(max_length=50)
+    snowballs_thrown = models.IntegerField(default=0)
+    snowball_hits = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('match', 'summoner')
 
     def match_result(self):
         if self.win:
@@ -203,6 +261,31 @@ class Participant(models.Model):
         return f"{self.game_name} playing {self.champion} in match {self.match}"
 
 
+class MatchCard(models.Model):
+    """The parts of a match-history card shared by all ten players: duration and both team lists."""
+    match = models.OneToOneField(Match, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    duration = models.CharField(max_length=10)
+    teams = models.JSONField()
+
+    def __str__(self):
+        return f"Card for {self.match_id}"
+
+
+class ParticipantCard(models.Model):
+    """One player's side of a match card, written at ingest so a history page is read from this table alone."""
+    summoner = models.ForeignKey(Summoner, on_delete=models.CASCADE, related_name='match_cards')
+    match = models.ForeignKey(MatchCard, on_delete=models.CASCADE, related_name='participant_cards')
+    game_start = models.DateTimeField()
+    card = models.JSONField()
+
+    class Meta:
+        unique_together = ('summoner', 'match')
+        indexes = [models.Index(fields=['summoner', '-game_start', '-match'])]
+
+    def __str__(self):
+        return f"Card for {self.summoner_id} in {self.match_id}"
+
+
 class SummonerChampionStats(models.Model):
     summoner = models.ForeignKey(Summoner, on_delete=models.CASCADE, related_name='champion_stats')
     champion = models.ForeignKey(Champion, on_delete=models.CASCADE, related_name='summoner_stats')
@@ -225,19 +308,6 @@ class SummonerChampionStats(models.Model):
     def __str__(self):
         return f"stats for {self.summoner.game_name}:{self.champion.name} in {self.year}"
 
-    def update_stats(self, participant: Participant, match: Match):
-        self.total_played += 1
-        self.duration_played += match.game_duration
-        self.total_creep_score += participant.creep_score
-        if participant.win:
-            self.total_wins += 1
-        else:
-            self.total_losses += 1
-        self.total_kills += participant.kills
-        self.total_deaths += participant.deaths
-        self.total_assists += participant.assists
-        self.save()
-
 
 class AccountStats(models.Model):
     summoner = models.ForeignKey(Summoner, on_delete=models.CASCADE, related_name='account_stats')
@@ -261,18 +331,21 @@ class AccountStats(models.Model):
         hit_rate = (self.snowball_hits / self.snowballs_thrown * 100) if self.snowballs_thrown > 0 else 0
         return  f"{int(round(hit_rate))}%"
 
-    def update_stats(self, participant: Participant, snowballs):
-        self.total_played += 1
-        if participant.win:
-            self.total_wins += 1
-        else:
-            self.total_losses += 1
-        self.total_kills += participant.kills
-        self.total_deaths += participant.deaths
-        self.total_assists += participant.assists
-        self.snowballs_thrown += snowballs[1]
-        self.snowball_hits += snowballs[0]
-        self.save()
+
+class TeammateStats(models.Model):
+    """Games a summoner played on the same team as another summoner, bucketed by the month they were played in."""
+    summoner = models.ForeignKey(Summoner, on_delete=models.CASCADE, related_name='teammate_stats')
+    teammate = models.ForeignKey(Summoner, on_delete=models.CASCADE, related_name='+')
+    month = models.DateField()
+    games = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0)
+    last_played = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('summoner', 'month', 'teammate')
+
+    def __str__(self):
+        return f"{self.summoner} with {self.teammate} in {self.month:%Y-%m}"
 
 
 class ChampionStatsPatch(models.Model):
@@ -284,14 +357,7 @@ class ChampionStatsPatch(models.Model):
 
     class Meta:
         unique_together = ('champion', 'patch')
+        indexes = [models.Index(fields=['patch'])]
 
     def __str__(self):
         return f"Stats {self.champion}:{self.patch}"
-
-    def update_stats(self, participant: Participant):
-        self.total_played += 1
-        if participant.win:
-            self.total_wins += 1
-        else:
-            self.total_losses += 1
-        self.save()
\ No newline at end of file
@@ -1,40 +1,141 @@
 import os
 
-from celery import shared_task
+from celery import shared_task, chord
 
 from match_history.util.populate_data import Summoner, MatchManager
+from match_history.util.progress import root_progress_recorder
+from match_history.util.rate_limit import INTERACTIVE
+from match_history.util.backfill_slots import acquire_backfill_slot, refresh_backfill_slot, release_backfill_slot
+from match_history.util.summoner_lock import SummonerLock, SummonerLockHeld
 from celery_progress.backend import ProgressRecorder
 
+BACKFILL_CHUNK_SIZE = 100
+BACKFILL_SLOT_RETRY = 30  # seconds between attempts to start a backfill while all slots are taken
+# Redis priorities: 0 is served first. A running backfill's callback jumps ahead of queued chunks.
+FINISH_PRIORITY = 0
+
 
 @shared_task(bind=True)
 def process_matches(self, summoner_id):
-    print('test')
+    """
+    Coordinates a summoner's backfill: fetches the matchlist, then replaces itself with a chord of chunk tasks so the
+    history is spread over every worker. The chord keeps this task's id, so celery-progress polls it until
+    finish_backfill has run. At most MAX_CONCURRENT_BACKFILLS backfills run at once; others wait for a slot.
+    The summoner's lock is held under this task's id until finish_backfill releases it, and is handed off whenever
+    the backfill goes back to the queue.
+    """
+    root_id = self.request.id
+    lock = SummonerLock(summoner_id, root_id)
+    try:
+        with lock.heartbeat():
+            has_slot = acquire_backfill_slot(root_id)
+            new_match_ids = _prepare_backfill(self, summoner_id) if has_slot else None
+    except SummonerLockHeld as e:
+        print(f"Backfill of {summoner_id} skipped: {e}")
+        return
+    if not has_slot:
+        # The lock is kept while waiting, so the summoner cannot be enqueued a second time meanwhile.
+        lock.hand_off()
+        raise self.retry(countdown=BACKFILL_SLOT_RETRY, max_retries=None)
+    if not new_match_ids:
+        release_backfill_slot(root_id)
+        lock.release()
+        return
+
+    # Covers the chunks and finish_backfill while they wait in the queue.
+    lock.hand_off()
+    chunks = [new_match_ids[start:start + BACKFILL_CHUNK_SIZE]
+              for start in range(0, len(new_match_ids), BACKFILL_CHUNK_SIZE)]
+    return self.replace(chord(
+        [process_match_chunk.s(summoner_id, chunk, root_id) for chunk in chunks],
+        finish_backfill.s(summoner_id, root_id).set(priority=FINISH_PRIORITY),
+    ))
+
+
+def _prepare_backfill(task, summoner_id):
+    """Fetches the matchlist and returns the ids still to ingest; finishes the backfill right away if there are none."""
     try:
-        progress_recorder = ProgressRecorder(self)
         summoner = Summoner.objects.get(puuid=summoner_id)
-        match_builder = MatchManager("americas", "na1", summoner)
-        match_builder.process_matches(progress_recorder=progress_recorder)
     except Summoner.DoesNotExist:
         print(f"Summoner with id {summoner_id} does not exist")
+        return []
+
+    match_builder = MatchManager("americas", "na1", summoner)
+    try:
+        new_match_ids = match_builder.prepare_backfill(progress_recorder=ProgressRecorder(task))
+    except Exception as e:
+        print(f"Summoner could not be parsed: {e}")
+        match_builder.finish_backfill(advance_cursor=False)
+        return []
+    if not new_match_ids:
+        match_builder.finish_backfill()
+    return new_match_ids
+
+
+@shared_task(bind=True)
+def process_match_chunk(self, summoner_id, match_ids, root_id):
+    """Returns the chunk's match ids, so finish_backfill can check which of them made it into the database."""
+    match_builder = None
+    lock = SummonerLock(summoner_id, root_id)
+    # Every chunk keeps the backfill's slot alive, however long the whole chord takes.
+    refresh_backfill_slot(root_id)
+    try:
+        with lock.heartbeat():
+            summoner = Summoner.objects.get(puuid=summoner_id)
+            match_builder = MatchManager("americas", "na1", summoner)
+            match_builder.process_match_ids(match_ids, progress_recorder=root_progress_recorder(self, root_id))
     except Exception as e:
-        print("Summoner could not be parsed")
+        # Swallowed so the chord still reaches finish_backfill. A chunk that could not take the lock does no work.
+        print(f"Chunk of {len(match_ids)} matches for {summoner_id} could not be parsed: {e}")
     finally:
-        summoner.being_parsed = False
-        summoner.save()
+        if match_builder:
+            match_builder.release_claims()
+        refresh_backfill_slot(root_id)
+        # Covers the chunks and finish_backfill still waiting in the queue.
+        lock.hand_off()
+    return match_ids
+
+
+@shared_task
+def finish_backfill(chunk_results, summoner_id, root_id):
+    release_backfill_slot(root_id)
+    try:
+        summoner = Summoner.objects.get(puuid=summoner_id)
+        # Chord results keep the order of the chunks, so this is the backfilled matchlist, newest first.
+        match_ids = [match_id for chunk in chunk_results for match_id in chunk]
+        MatchManager("americas", "na1", summoner).finish_backfill(match_ids)
+    except Summoner.DoesNotExist:
+        return
+    finally:
+        SummonerLock(summoner_id, root_id).release()
 
 
 @shared_task(bind=True)
 def update_matches(self, summoner_id):
     print("task is being started")
+    lock = SummonerLock(summoner_id, self.request.id)
+    try:
+        with lock.heartbeat():
+            _update_matches(self, summoner_id)
+    except SummonerLockHeld as e:
+        print(f"Update of {summoner_id} skipped: {e}")
+    finally:
+        lock.release()
+
+
+def _update_matches(task, summoner_id):
     summoner = None
+    match_builder = None
     try:
-        progress_recorder = ProgressRecorder(self)
+        progress_recorder = ProgressRecorder(task)
         summoner = Summoner.objects.get(puuid=summoner_id)
-        match_builder = MatchManager("americas", "na1", summoner)
+        match_builder = MatchManager("americas", "na1", summoner, priority=INTERACTIVE)
         match_builder.last_20(progress_recorder=progress_recorder)
     except Summoner.DoesNotExist:
         print(f"Summoner with id {summoner_id} does not exist")
     finally:
+        if match_builder:
+            match_builder.release_claims()
         if summoner:
             summoner.being_parsed = False
             summoner.save()
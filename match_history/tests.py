@@ -1,9 +1,51 @@
-from django.test import TransactionTestCase, TestCase
+import asyncio
+import bisect
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import TransactionTestCase, TestCase, SimpleTestCase
 from django.core.cache import cache
+from django.urls import reverse
 from unittest.mock import patch
 from .models import *
 from AramGoV2.util.current_patch import get_patch
 from match_history.apps import MatchHistoryConfig
+from match_history.util.asset_cache import AssetResolver, bump_asset_version
+from match_history.util.stat_aggregator import StatAggregator
+from match_history.util.riot_client import AsyncRiotClient, RiotFetcher
+from match_history.util.rate_limit import RateLimitScheduler, LocalBucketStore, BACKFILL, INTERACTIVE, parse_limits
+from match_history.util.match_archive import load_matches
+from match_history.util.batch_jobs import iter_chunks
+from match_history.util.populate_data import MatchManager, COUNT
+from match_history.util.pipeline import MatchPipeline
+from match_history.util.match_claims import MatchClaims
+from match_history.util.frontier import Frontier
+from match_history.util.crawler import Crawler
+from match_history.util.summoner_lock import SummonerLock, SummonerLockHeld, enqueue_for_summoner, crawler_owner
+from match_history.util.profile_snapshot import get_profile_version, get_profile_snapshot, bump_profile_epoch
+from match_history.util.teammates import top_teammates
+from match_history.util.keyset import keyset_page, decode_cursor
+from match_history.util.match_cards import present_cards
+from match_history.util.card_fragments import render_match_cards
+from match_history.util.tier_list import get_tier_list, wilson_lower_bound
+from match_history.util.patch_provider import patch_provider, publish_patch
+from match_history.util.backfill_slots import acquire_backfill_slot, refresh_backfill_slot, release_backfill_slot
+from match_history.util.progress import ProgressReporter, root_progress_recorder
+from match_history.tasks import process_matches
+from match_history.management.commands.rebuild_stats import rebuild_summoner_partition, rebuild_patch_partition, \
+    rebuild_teammate_partition, summoner_bounds, patch_versions
+from match_history.management.commands.ingest_dump import iter_documents, ingest_chunk
+from match_history.management.commands.build_match_cards import iter_match_chunks, build_chunk
+from riotwatcher import ApiError
 
 
 class MatchParticipantDBTest(TransactionTestCase):
@@ -98,3 +140,882 @@ class PatchVersionCacheTest(TestCase):
         
         # Verify that the mock was called
         mock_get_patch.assert_called_once()
+
+class AssetResolverTest(TestCase):
+    def setUp(self):
+        Champion.objects.create(champion_id='MonkeyKing', name='Wukong', title='the Monkey King',
+                                image_path='MonkeyKing.png', splash_image_path='MonkeyKing_0.jpg')
+        Item.objects.create(item_id='3078', name='Trinity Force', image_path='3078.png')
+        SummonerSpell.objects.create(spell_id=32, name='Mark', image_path='SummonerSnowball.png')
+        ProfileIcon.objects.create(profile_id='29', image_path='29.png')
+
+    def test_lookups_cost_no_queries(self):
+        resolver = AssetResolver()
+        resolver.refresh()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.champion('monkeyking').name, 'Wukong')
+            self.assertEqual(resolver.item(3078).name, 'Trinity Force')
+            self.assertEqual(resolver.spell('32').name, 'Mark')
+            self.assertEqual(resolver.profile_icon(29).image_path, '29.png')
+            self.assertIsNone(resolver.rune(8000))
+
+    def test_sync_reloads_when_asset_version_changes(self):
+        resolver = AssetResolver()
+        resolver.sync()
+        Item.objects.create(item_id='6653', name="Liandry's Torment", image_path='6653.png')
+        self.assertIsNone(resolver.item(6653))
+        bump_asset_version()
+        resolver.sync()
+        self.assertEqual(resolver.item(6653).name, "Liandry's Torment")
+
+
+class StatAggregatorTest(TestCase):
+    def setUp(self):
+        self.summoner = Summoner.objects.create(puuid='agg-puuid', game_name='agg', tag_line='NA1')
+        self.champion = Champion.objects.create(champion_id='Sona', name='Sona', title='Maven of the Strings',
+                                                image_path='Sona.png', splash_image_path='Sona_0.jpg')
+        self.match = Match.objects.create(match_id='NA1_1', game_start=timezone.now(), game_duration=1200,
+                                          game_mode='ARAM', game_version='14.17.612.2', winner=100)
+
+    def _participant(self, win):
+        return Participant(match=self.match, summoner=self.summoner, champion=self.champion, kills=5, deaths=2,
+                           assists=20, creep_score=30, team=100, win=win, game_name='agg')
+
+    def test_flush_merges_deltas_per_key(self):
+        stats = StatAggregator()
+        stats.add(self._participant(True), self.match, (3, 10))
+        stats.add(self._participant(False), self.match, (1, 4))
+        # One upsert per table, whether or not the rows exist yet.
+        with self.assertNumQueries(3):
+            stats.flush()
+
+        champion_stats = SummonerChampionStats.objects.get(summoner=self.summoner, champion=self.champion)
+        self.assertEqual(champion_stats.total_played, 2)
+        self.assertEqual(champion_stats.total_wins, 1)
+        self.assertEqual(champion_stats.duration_played, 2400)
+        account_stats = AccountStats.objects.get(summoner=self.summoner)
+        self.assertEqual((account_stats.snowball_hits, account_stats.snowballs_thrown), (4, 14))
+        self.assertEqual(ChampionStatsPatch.objects.get(champion=self.champion, patch='14.17').total_losses, 1)
+
+    def test_flush_increments_existing_rows(self):
+        ChampionStatsPatch.objects.create(champion=self.champion, patch='14.17', total_played=5, total_wins=5)
+        stats = StatAggregator()
+        stats.add(self._participant(True), self.match, (0, 0))
+        stats.flush()
+        self.assertEqual(ChampionStatsPatch.objects.get(champion=self.champion, patch='14.17').total_played, 6)
+
+
+class _StubRiotHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/lol/match/v5/matches/NA1_404'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path.startswith('/lol/match/v5/matches/by-puuid/'):
+            body = ['NA1_1', 'NA1_2']
+        else:
+            body = {'metadata': {'matchId': self.path.rsplit('/', 1)[-1]}, 'token': self.headers['X-Riot-Token']}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RiotFetcherTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubRiotHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{self.server.server_port}'
+        self.fetcher = RiotFetcher(AsyncRiotClient('test-key', concurrency=4, base_url=base_url))
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_matchlist_and_matches(self):
+        match_ids = self.fetcher.matchlist_by_puuid('americas', 'puuid', queue=450, count=100, start=0)
+        self.assertEqual(match_ids, ['NA1_1', 'NA1_2'])
+        matches = self.fetcher.fetch_matches('americas', match_ids + ['NA1_404'])
+        self.assertEqual(set(matches), {'NA1_1', 'NA1_2'})
+        self.assertEqual(matches['NA1_1']['token'], 'test-key')
+
+    def test_error_status_raises_api_error(self):
+        with self.assertRaises(ApiError):
+            self.fetcher.run(self.fetcher._client.match_by_id('americas', 'NA1_404'))
+
+
+class RateLimitSchedulerTest(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = RateLimitScheduler(LocalBucketStore(), '10:10', method_limits={}, backfill_reserve=0.5)
+
+    def test_backfill_leaves_reserve_for_interactive(self):
+        backfill_granted = 0
+        while not self.scheduler.delay('americas', 'match-v5.match', BACKFILL):
+            backfill_granted += 1
+        self.assertEqual(backfill_granted, 5)
+        for _ in range(5):
+            self.assertEqual(self.scheduler.delay('americas', 'match-v5.match', INTERACTIVE), 0)
+        self.assertGreater(self.scheduler.delay('americas', 'match-v5.match', INTERACTIVE), 0)
+
+    def test_no_window_admits_more_than_its_limit(self):
+        now = [0.0]
+        scheduler = RateLimitScheduler(LocalBucketStore(clock=lambda: now[0]), '20:1,100:120', method_limits={})
+        admitted = []
+        while now[0] < 360:
+            if not scheduler.delay('americas', 'match-v5.match', INTERACTIVE):
+                admitted.append(now[0])
+            now[0] += 0.05
+        for count, period in [(20, 1), (100, 120)]:
+            for i, start in enumerate(admitted):
+                self.assertLessEqual(bisect.bisect_left(admitted, start + period) - i, count)
+        self.assertEqual(len(admitted), 300)
+
+    def test_async_acquire_keeps_store_calls_off_the_loop(self):
+        class SlowStore:
+            def acquire(self, scope, buckets, reserve):
+                time.sleep(0.2)
+                return 0
+
+        scheduler = RateLimitScheduler(SlowStore(), '10:10', method_limits={})
+
+        async def acquire_many():
+            start = time.monotonic()
+            await asyncio.gather(*(scheduler.acquire('americas', 'match-v5.match') for _ in range(4)))
+            return time.monotonic() - start
+
+        self.assertLess(asyncio.run(acquire_many()), 0.6)
+
+    def test_adopts_reported_limits_and_retry_after(self):
+        self.scheduler.update_from_response('americas', 'match-v5.match', 429,
+                                            {'X-App-Rate-Limit': '100:1', 'X-Method-Rate-Limit': '50:10',
+                                             'Retry-After': '3'})
+        self.assertEqual(parse_limits('20:1,100:120'), [(20, 1), (100, 120)])
+        self.assertGreater(self.scheduler.delay('americas', 'match-v5.match', INTERACTIVE), 2)
+        self.assertEqual(self.scheduler.delay('europe', 'match-v5.match', INTERACTIVE), 0)
+        self.assertEqual(self.scheduler._buckets('europe', 'match-v5.match'),
+                         [('europe:app:1', 100, 1), ('europe:match-v5.match:10', 50, 10)])
+
+
+def _match_payload(match_id, game_start=1725000000000, champion='Sona'):
+    participants = []
+    for i in range(10):
+        participants.append({
+            'puuid': f'puuid-{i}', 'riotIdGameName': f'player{i}', 'riotIdTagline': 'NA1', 'summonerName': '',
+            'summonerLevel': 100, 'profileIcon': 29, 'championName': champion, 'teamId': 100 if i < 5 else 200,
+            'win': i < 5, 'kills': i, 'deaths': 3, 'assists': 10, 'totalMinionsKilled': 20,
+            'summoner1Id': 32, 'summoner2Id': 4, 'summoner1Casts': 6, 'summoner2Casts': 1,
+            'challenges': {'snowballsHit': 2},
+            'perks': {'styles': [{'selections': [{'perk': 8214}]}, {'style': 8300}]},
+            'item0': 3078, 'item1': 0, 'item2': 0, 'item3': 0, 'item4': 0, 'item5': 0, 'item6': 0,
+        })
+    return {
+        'metadata': {'matchId': match_id, 'participants': [p['puuid'] for p in participants]},
+        'info': {'gameStartTimestamp': game_start, 'gameDuration': 1200, 'gameMode': 'ARAM',
+                 'gameVersion': '14.17.612.2', 'teams': [{'win': True}, {'win': False}],
+                 'participants': participants},
+    }
+
+
+def _create_assets():
+    Champion.objects.create(champion_id='Sona', name='Sona', title='Maven of the Strings',
+                            image_path='Sona.png', splash_image_path='Sona_0.jpg')
+    Item.objects.create(item_id='3078', name='Trinity Force', image_path='3078.png')
+    SummonerSpell.objects.create(spell_id=32, name='Mark', image_path='SummonerSnowball.png')
+    SummonerSpell.objects.create(spell_id=4, name='Flash', image_path='SummonerFlash.png')
+    bump_asset_version()
+
+
+class MatchPersistenceTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        self.manager = MatchManager('americas', 'na1', None)
+
+    def test_persist_batch_writes_rows_and_archive(self):
+        self.manager._persist_batch({'NA1_1': _match_payload('NA1_1'), 'NA1_2': _match_payload('NA1_2')})
+        self.assertEqual(Participant.objects.filter(match_id='NA1_1').count(), 10)
+        self.assertEqual(Participant.objects.get(match_id='NA1_1', summoner_id='puuid-0').item1_id, '3078')
+        self.assertEqual(load_matches(['NA1_2'])['NA1_2'], _match_payload('NA1_2'))
+        self.assertEqual(AccountStats.objects.get(summoner_id='puuid-0').snowballs_thrown, 12)
+
+    def test_summoner_upsert_only_writes_stale_rows(self):
+        Summoner.objects.create(puuid='puuid-0', game_name='renamed', last_updated=timezone.now(), being_parsed=True)
+        Summoner.objects.create(puuid='puuid-1', game_name='old name', last_updated=timezone.now() - timedelta(days=4000))
+        payload = _match_payload('NA1_1')
+        match = self.manager._build_match('NA1_1', payload['info'])
+        with self.assertNumQueries(2):
+            summoners = self.manager._upsert_summoners([(payload, match)])
+        self.assertEqual(len(summoners), 10)
+        self.assertEqual(Summoner.objects.get(puuid='puuid-0').game_name, 'renamed')
+        self.assertEqual(Summoner.objects.get(puuid='puuid-1').game_name, 'player1')
+        self.assertTrue(Summoner.objects.get(puuid='puuid-0').being_parsed)
+        self.assertEqual(Summoner.objects.count(), 10)
+
+    def test_persisting_again_updates_participants_in_place(self):
+        self.manager._persist_batch({'NA1_1': _match_payload('NA1_1')})
+        payload = _match_payload('NA1_1')
+        payload['info']['participants'][0].update({'kills': 12, 'item0': 0, 'item5': 3078, 'summoner1Id': 4,
+                                                   'summoner2Id': 32, 'summoner2Casts': 9})
+        self.manager._persist_batch({'NA1_1': payload})
+        self.assertEqual(Match.objects.count(), 1)
+        self.assertEqual(Participant.objects.count(), 10)
+        participant = Participant.objects.get(match_id='NA1_1', summoner_id='puuid-0')
+        self.assertEqual((participant.kills, participant.deaths, participant.assists, participant.creep_score),
+                         (12, 3, 10, 20))
+        self.assertEqual([getattr(participant, f'item{slot}_id') for slot in range(1, 7)],
+                         [None, None, None, None, None, '3078'])
+        self.assertEqual((participant.spell1_id, participant.spell2_id, participant.rune1_id, participant.rune2_id),
+                         (4, 32, None, None))
+        self.assertEqual((participant.champion_id, participant.team, participant.win, participant.game_name),
+                         ('Sona', 100, True, 'player0'))
+        self.assertEqual((participant.snowballs_thrown, participant.snowball_hits), (9, 2))
+        self.assertEqual(Participant.objects.get(match_id='NA1_1', summoner_id='puuid-7').win, False)
+
+    def test_reprocessing_does_not_count_stats_twice(self):
+        self.manager._persist_batch({'NA1_1': _match_payload('NA1_1')})
+        self.manager._persist_batch(load_matches(['NA1_1']), archive=False)
+        self.assertEqual(ChampionStatsPatch.objects.get(champion_id='Sona', patch='14.17').total_played, 10)
+        self.assertEqual(Participant.objects.count(), 10)
+
+
+class MatchPipelineTest(SimpleTestCase):
+    def test_keeps_depth_fetches_in_flight_while_persisting(self):
+        submitted, persisted, in_flight = [], [], []
+
+        def submit_fetch(batch):
+            submitted.append(batch)
+            future = Future()
+            future.set_result({match_id: {} for match_id in batch})
+            return future
+
+        def persist(match_data):
+            in_flight.append(len(submitted) - len(persisted) - 1)
+            persisted.append(list(match_data))
+
+        pipeline = MatchPipeline(submit_fetch, persist, depth=2)
+        batches = [['NA1_1', 'NA1_2'], ['NA1_3'], ['NA1_4'], ['NA1_5']]
+        self.assertEqual([batch for batch, _ in pipeline.run(batches)], batches)
+        self.assertEqual(persisted, batches)
+        self.assertEqual(in_flight, [2, 2, 1, 0])
+        self.assertEqual(pipeline.persist_stats.matches, 5)
+        self.assertEqual(pipeline.fetch_stats.matches, 5)
+
+
+class IncrementalSyncTest(TestCase):
+    def test_refresh_stops_at_sync_cursor(self):
+        summoner = Summoner.objects.create(puuid='sync-puuid', game_name='sync', tag_line='NA1',
+                                           last_match_id='NA1_7', last_match_start=timezone.now())
+        calls = []
+
+        class Fetcher:
+            def matchlist_by_puuid(self, host, puuid, **params):
+                calls.append(params)
+                return [f'NA1_{i}' for i in range(10, 10 - COUNT, -1)]
+
+        manager = MatchManager('americas', 'na1', summoner)
+        manager._fetcher = Fetcher()
+        matches = manager._get_all(since=summoner.last_match_start, stop_at=summoner.last_match_id)
+        self.assertEqual(matches, ['NA1_10', 'NA1_9', 'NA1_8'])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0]['start_time'], int(summoner.last_match_start.timestamp()))
+
+    def test_cursor_stops_before_matches_that_failed_to_fetch(self):
+        _create_assets()
+        self.addCleanup(cache.clear)
+        payloads = {f'NA1_{i}': _match_payload(f'NA1_{i}', game_start=1725000000000 + i * 3600000) for i in range(4)}
+        MatchManager('americas', 'na1', None)._persist_batch({'NA1_0': payloads['NA1_0']})
+        summoner = Summoner.objects.get(puuid='puuid-0')
+        summoner.last_match_id, summoner.last_match_start = 'NA1_0', Match.objects.get(match_id='NA1_0').game_start
+        summoner.save()
+        dropped = {'NA1_2'}
+
+        class Fetcher:
+            def matchlist_by_puuid(self, host, puuid, **params):
+                return ['NA1_3', 'NA1_2', 'NA1_1', 'NA1_0']
+
+            def fetch_matches(self, host, match_ids, priority):
+                return {match_id: payloads[match_id] for match_id in match_ids if match_id not in dropped}
+
+        manager = MatchManager('americas', 'na1', summoner)
+        manager._fetcher = Fetcher()
+        manager.last_20()
+        self.assertEqual(Summoner.objects.get(puuid='puuid-0').last_match_id, 'NA1_1')
+
+        dropped.clear()
+        manager.last_20()
+        self.assertTrue(Match.objects.filter(match_id='NA1_2').exists())
+        self.assertEqual(Summoner.objects.get(puuid='puuid-0').last_match_id, 'NA1_3')
+
+    @patch('match_history.util.populate_data.INTERACTIVE_CLAIM_WAIT', 0.5)
+    def test_refresh_does_not_wait_out_other_claims(self):
+        _create_assets()
+        self.addCleanup(cache.clear)
+        payloads = {f'NA1_{i}': _match_payload(f'NA1_{i}', game_start=1725000000000 + i * 3600000) for i in range(3)}
+        MatchManager('americas', 'na1', None)._persist_batch({'NA1_0': payloads['NA1_0']})
+        summoner = Summoner.objects.get(puuid='puuid-0')
+        summoner.last_match_id, summoner.last_match_start = 'NA1_0', Match.objects.get(match_id='NA1_0').game_start
+        summoner.save()
+        MatchClaims().claim(['NA1_1'])
+
+        class Fetcher:
+            def matchlist_by_puuid(self, host, puuid, **params):
+                return ['NA1_2', 'NA1_1', 'NA1_0']
+
+            def fetch_matches(self, host, match_ids, priority):
+                return {match_id: payloads[match_id] for match_id in match_ids}
+
+        manager = MatchManager('americas', 'na1', summoner)
+        manager._fetcher = Fetcher()
+        start = time.monotonic()
+        manager.last_20()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(Match.objects.filter(match_id='NA1_2').exists())
+        self.assertFalse(Match.objects.filter(match_id='NA1_1').exists())
+        self.assertEqual(Summoner.objects.get(puuid='puuid-0').last_match_id, 'NA1_0')
+
+
+class MatchClaimsTest(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_each_match_is_claimed_once(self):
+        first, second = MatchClaims(), MatchClaims()
+        self.assertEqual(first.claim(['NA1_1', 'NA1_2']), (['NA1_1', 'NA1_2'], []))
+        self.assertEqual(second.claim(['NA1_2', 'NA1_3']), (['NA1_3'], ['NA1_2']))
+        second.release(['NA1_2'])
+        self.assertEqual(second.claim(['NA1_2']), ([], ['NA1_2']))
+        first.release_all()
+        self.assertEqual(second.claim(['NA1_1', 'NA1_2']), (['NA1_1', 'NA1_2'], []))
+
+
+class BackfillSlotTest(SimpleTestCase):
+    def tearDown(self):
+        cache.clear()
+
+    @patch('match_history.util.backfill_slots.settings.MAX_CONCURRENT_BACKFILLS', 2)
+    def test_backfills_are_capped(self):
+        self.assertTrue(acquire_backfill_slot('task-1'))
+        self.assertTrue(acquire_backfill_slot('task-2'))
+        self.assertFalse(acquire_backfill_slot('task-3'))
+        self.assertTrue(acquire_backfill_slot('task-1'))
+        release_backfill_slot('task-1')
+        self.assertTrue(acquire_backfill_slot('task-3'))
+
+    @patch('match_history.util.backfill_slots.settings.MAX_CONCURRENT_BACKFILLS', 1)
+    @patch('match_history.util.backfill_slots.SLOT_TIMEOUT', 0.3)
+    def test_refresh_keeps_slot_past_timeout(self):
+        self.assertTrue(acquire_backfill_slot('task-1'))
+        for _ in range(3):
+            time.sleep(0.2)
+            self.assertTrue(refresh_backfill_slot('task-1'))
+        self.assertFalse(acquire_backfill_slot('task-2'))
+        self.assertFalse(refresh_backfill_slot('task-2'))
+
+
+class SummonerLockTest(SimpleTestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_enqueue_returns_task_in_flight(self):
+        sent = []
+
+        class Task:
+            def apply_async(self, args, task_id=None, **options):
+                sent.append((args, task_id))
+
+        first_id, first_enqueued = enqueue_for_summoner(Task(), 'lock-puuid')
+        second_id, second_enqueued = enqueue_for_summoner(Task(), 'lock-puuid')
+        self.assertEqual((second_id, first_enqueued, second_enqueued), (first_id, True, False))
+        self.assertEqual(sent, [(('lock-puuid',), first_id)])
+
+        SummonerLock('lock-puuid', first_id).release()
+        third_id, third_enqueued = enqueue_for_summoner(Task(), 'lock-puuid')
+        self.assertTrue(third_enqueued)
+        self.assertNotEqual(third_id, first_id)
+
+    def test_enqueue_reports_crawls_as_busy(self):
+        SummonerLock('lock-puuid', crawler_owner()).acquire()
+        self.assertEqual(enqueue_for_summoner(None, 'lock-puuid'), (None, False))
+
+    def test_lock_expires_without_heartbeat(self):
+        lock = SummonerLock('lock-puuid', 'task-1', timeout=0.3)
+        with lock.heartbeat():
+            time.sleep(0.5)
+            self.assertEqual(lock.holder(), 'task-1')
+            self.assertFalse(SummonerLock('lock-puuid', 'task-2').acquire())
+        time.sleep(0.5)
+        self.assertTrue(SummonerLock('lock-puuid', 'task-2').acquire())
+
+    def test_heartbeat_refuses_to_run_without_the_lock(self):
+        SummonerLock('lock-puuid', 'task-1').acquire()
+        ran = []
+        with self.assertRaises(SummonerLockHeld):
+            with SummonerLock('lock-puuid', 'task-2').heartbeat():
+                ran.append(True)
+        self.assertEqual(ran, [])
+
+    def test_hand_off_covers_queued_work(self):
+        lock = SummonerLock('lock-puuid', 'task-1', timeout=0.3)
+        with lock.heartbeat():
+            pass
+        lock.hand_off(timeout=2)
+        time.sleep(0.5)
+        self.assertEqual(lock.holder(), 'task-1')
+
+
+class UpdateViewTest(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_busy_summoner_is_reported_without_a_task_id(self):
+        crawl = SummonerLock('puuid-0', crawler_owner())
+        crawl.acquire()
+        response = self.client.post(reverse('match_history:update'), {'summoner_id': 'puuid-0'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'status': 'busy'})
+        crawl.release()
+        with patch('match_history.views.update_matches') as update_matches:
+            response = self.client.post(reverse('match_history:update'), {'summoner_id': 'puuid-0'})
+        self.assertEqual(response.status_code, 202)
+        update_matches.apply_async.assert_called_once()
+
+
+class ProgressReporterTest(TestCase):
+    def test_coalesces_writes_and_flushes_on_close(self):
+        summoner = Summoner.objects.create(puuid='progress-puuid', total_matches=100, parsed_matches=0)
+        recorded = []
+
+        class Recorder:
+            def set_progress(self, current, total, description=''):
+                recorded.append((current, total))
+
+        with ProgressReporter(summoner, Recorder(), interval=3600, every=40) as progress:
+            for _ in range(50):
+                progress.advance(1)
+            self.assertEqual(recorded, [(40, 100)])
+            self.assertEqual(Summoner.objects.get(pk=summoner.pk).parsed_matches, 40)
+        self.assertEqual(recorded, [(40, 100), (50, 100)])
+        self.assertEqual(Summoner.objects.get(pk=summoner.pk).parsed_matches, 50)
+
+
+class BackfillTaskTest(TestCase):
+    def setUp(self):
+        self.summoner = Summoner.objects.create(puuid='backfill-puuid', game_name='backfill', tag_line='NA1',
+                                                being_parsed=True, total_matches=10, parsed_matches=0)
+
+    def tearDown(self):
+        cache.clear()
+
+    @patch('match_history.tasks.BACKFILL_CHUNK_SIZE', 2)
+    def test_coordinator_fans_out_chunks_and_finishes_once(self):
+        match_ids = [f'NA1_{i}' for i in range(5, 0, -1)]
+        chunks, finished = [], []
+        finish_backfill = MatchManager.finish_backfill
+
+        def record_finish(manager, *args, **kwargs):
+            finished.append(args)
+            finish_backfill(manager, *args, **kwargs)
+
+        def record_chunk(manager, ids, progress_recorder=None):
+            chunks.append(ids)
+
+        with patch.object(MatchManager, 'prepare_backfill', return_value=match_ids), \
+                patch.object(MatchManager, 'process_match_ids', record_chunk), \
+                patch.object(MatchManager, 'finish_backfill', record_finish):
+            process_matches.apply(args=('backfill-puuid',), task_id='root-task')
+
+        self.assertEqual(chunks, [['NA1_5', 'NA1_4'], ['NA1_3', 'NA1_2'], ['NA1_1']])
+        self.assertEqual(finished, [(match_ids,)])
+        self.assertFalse(Summoner.objects.get(puuid='backfill-puuid').being_parsed)
+        self.assertIsNone(SummonerLock('backfill-puuid', 'root-task').holder())
+        self.assertTrue(acquire_backfill_slot('next-task'))
+
+    def test_coordinator_exits_while_another_task_holds_the_lock(self):
+        SummonerLock('backfill-puuid', 'other-task').acquire()
+        with patch.object(MatchManager, 'prepare_backfill') as prepare_backfill:
+            process_matches.apply(args=('backfill-puuid',), task_id='root-task')
+        prepare_backfill.assert_not_called()
+        self.assertTrue(Summoner.objects.get(puuid='backfill-puuid').being_parsed)
+        self.assertEqual(SummonerLock('backfill-puuid', 'root-task').holder(), 'other-task')
+
+    def test_chunks_add_up_progress_on_the_root_task(self):
+        states = []
+
+        class ChunkTask:
+            def update_state(self, task_id=None, state=None, meta=None):
+                states.append((task_id, meta['current'], meta['total']))
+
+        # Two chunk tasks, each with its own copy of the summoner row.
+        first = ProgressReporter(Summoner.objects.get(puuid='backfill-puuid'),
+                                 root_progress_recorder(ChunkTask(), 'root-task'), interval=3600, every=1000)
+        second = ProgressReporter(Summoner.objects.get(puuid='backfill-puuid'),
+                                  root_progress_recorder(ChunkTask(), 'root-task'), interval=3600, every=1000)
+        first.advance(3)
+        second.advance(4)
+        first.close()
+        second.close()
+        self.assertEqual(states, [('root-task', 3, 10), ('root-task', 7, 10)])
+        self.assertEqual(Summoner.objects.get(puuid='backfill-puuid').parsed_matches, 7)
+
+
+class RebuildStatsTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        self.manager = MatchManager('americas', 'na1', None)
+
+    def test_rebuild_matches_incremental_stats(self):
+        self.manager._persist_batch({'NA1_1': _match_payload('NA1_1'), 'NA1_2': _match_payload('NA1_2')})
+
+        def snapshot():
+            return (
+                sorted(SummonerChampionStats.objects.values_list('summoner_id', 'champion_id', 'year', 'total_played',
+                                                                 'duration_played', 'total_wins', 'total_kills')),
+                sorted(AccountStats.objects.values_list('summoner_id', 'year', 'total_played', 'total_losses',
+                                                        'snowballs_thrown', 'snowball_hits')),
+                sorted(ChampionStatsPatch.objects.values_list('champion_id', 'patch', 'total_played', 'total_wins')),
+                sorted(TeammateStats.objects.values_list('summoner_id', 'teammate_id', 'month', 'games', 'wins',
+                                                         'last_played')),
+            )
+
+        incremental = snapshot()
+        self.assertEqual(len(incremental[3]), 40)
+        AccountStats.objects.update(total_played=999)
+        # As for matches ingested before TeammateStats existed.
+        TeammateStats.objects.all().delete()
+        for year in {date.year for date in Match.objects.dates('game_start', 'year')}:
+            for low, high in summoner_bounds(3):
+                rebuild_summoner_partition((year, low, high))
+                rebuild_teammate_partition((year, low, high))
+        for partition in patch_versions().items():
+            rebuild_patch_partition(partition)
+        self.assertEqual(snapshot(), incremental)
+
+
+class IngestDumpTest(TestCase):
+    def setUp(self):
+        _create_assets()
+
+    def test_reads_json_and_gzipped_jsonl(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'single.json'), 'w') as dump:
+                json.dump(_match_payload('NA1_1'), dump)
+            with gzip.open(os.path.join(directory, 'batch.jsonl.gz'), 'wt') as dump:
+                dump.write(json.dumps(_match_payload('NA1_2')) + '\n\n' + json.dumps(_match_payload('NA1_3')) + '\n')
+            chunks = list(iter_chunks(iter_documents(Path(directory)), 2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual(sum(ingest_chunk(chunk) for chunk in chunks), 3)
+        self.assertEqual(Participant.objects.count(), 30)
+
+
+class FrontierTest(TestCase):
+    def test_ingestion_discovers_players_once_per_game(self):
+        _create_assets()
+        manager = MatchManager('americas', 'na1', None)
+        manager._persist_batch({'NA1_1': _match_payload('NA1_1'), 'NA1_2': _match_payload('NA1_2')})
+        manager._persist_batch({'NA1_2': _match_payload('NA1_2')})
+        self.assertEqual(CrawlFrontier.objects.count(), 10)
+        self.assertEqual(CrawlFrontier.objects.get(puuid='puuid-3').games_seen, 2)
+
+    def test_claims_unvisited_and_active_players_first(self):
+        frontier = Frontier(revisit_after=timedelta(hours=1))
+        frontier.discover(['quiet', 'active', 'active', 'crawled', 'stale'])
+        CrawlFrontier.objects.filter(puuid='crawled').update(last_crawled=timezone.now())
+        CrawlFrontier.objects.filter(puuid='stale').update(last_crawled=timezone.now() - timedelta(hours=2))
+        self.assertEqual(frontier.claim(2), ['active', 'quiet'])
+        self.assertEqual(frontier.claim(5), ['stale'])
+        frontier.mark_visited('active')
+        self.assertTrue(frontier.visited('active'))
+        self.assertFalse(frontier.visited('quiet'))
+
+    def test_crawl_leaves_profile_viewable(self):
+        _create_assets()
+        self.addCleanup(cache.clear)
+        MatchManager('americas', 'na1', None)._persist_batch({'NA1_1': _match_payload('NA1_1')})
+        flags = []
+
+        class Fetcher:
+            def matchlist_by_puuid(self, host, puuid, **params):
+                return ['NA1_2', 'NA1_1']
+
+            def fetch_matches(self, host, match_ids, priority):
+                flags.append(Summoner.objects.get(puuid='puuid-0').being_parsed)
+                return {match_id: _match_payload(match_id, game_start=1726000000000) for match_id in match_ids}
+
+            def submit_fetch_matches(self, host, match_ids, priority):
+                future = Future()
+                future.set_result(self.fetch_matches(host, match_ids, priority))
+                return future
+
+        with patch('match_history.util.populate_data.get_fetcher', return_value=Fetcher()):
+            Crawler('americas', 'na1', concurrency=1).crawl_one('puuid-0')
+        self.assertEqual(flags, [False])
+        self.assertTrue(Match.objects.filter(match_id='NA1_2').exists())
+        self.assertFalse(Summoner.objects.get(puuid='puuid-0').being_parsed)
+
+
+def _rendered_match_ids(response):
+    return re.findall(r'data-match-id="([^"]+)"', response.content.decode())
+
+
+class ProfileSnapshotTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        self.manager = MatchManager('americas', 'na1', None)
+        self.manager._persist_batch({'NA1_1': _match_payload('NA1_1')})
+        self.url = reverse('match_history:details', args=['player0', 'NA1'])
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_cached_profile_skips_profile_queries(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(_rendered_match_ids(second), ['NA1_1'])
+
+    def test_ingestion_invalidates_snapshot(self):
+        self.client.get(self.url)
+        version = get_profile_version('puuid-0')
+        self.manager._persist_batch({'NA1_2': _match_payload('NA1_2', game_start=1726000000000)})
+        self.assertNotEqual(get_profile_version('puuid-0'), version)
+        self.assertEqual(_rendered_match_ids(self.client.get(self.url)), ['NA1_2', 'NA1_1'])
+
+    def test_epoch_bump_rebuilds_snapshot(self):
+        builds = []
+
+        def build():
+            builds.append(True)
+            return {'stats': len(builds)}
+
+        self.assertEqual(get_profile_snapshot('puuid-0', build), {'stats': 1})
+        self.assertEqual(get_profile_snapshot('puuid-0', build), {'stats': 1})
+        bump_profile_epoch()
+        self.assertEqual(get_profile_snapshot('puuid-0', build), {'stats': 2})
+
+
+class TeammateIndexTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        self.manager = MatchManager('americas', 'na1', None)
+
+    def test_ingestion_counts_games_together(self):
+        self.manager._persist_batch({'NA1_1': _match_payload('NA1_1'), 'NA1_2': _match_payload('NA1_2')})
+        self.manager._persist_batch({'NA1_2': _match_payload('NA1_2'),
+                                     'NA1_3': _match_payload('NA1_3', game_start=1726000000000)})
+        self.assertEqual(TeammateStats.objects.filter(summoner_id='puuid-0').count(), 8)
+        pair = TeammateStats.objects.get(summoner_id='puuid-0', teammate_id='puuid-1', month__month=8)
+        self.assertEqual((pair.games, pair.wins), (2, 2))
+        self.assertFalse(TeammateStats.objects.filter(summoner_id='puuid-0', teammate_id='puuid-5').exists())
+
+        teammates = top_teammates(Summoner.objects.get(puuid='puuid-7'), limit=2)
+        self.assertEqual([teammate['participant'].puuid for teammate in teammates], ['puuid-5', 'puuid-6'])
+        self.assertEqual((teammates[0]['total_losses'], teammates[0]['winrate']), (3, 0))
+        self.assertEqual(top_teammates(Summoner.objects.get(puuid='puuid-7'), days=1), [])
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        # Pairs of matches share a start time, so the match_id tiebreak is exercised.
+        MatchManager('americas', 'na1', None)._persist_batch(
+            {f'NA1_{i}': _match_payload(f'NA1_{i}', game_start=1725000000000 + i // 2 * 60000) for i in range(25)})
+        self.url = reverse('match_history:details', args=['player0', 'NA1'])
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_pages_cover_every_match_once(self):
+        queryset = Match.objects.filter(participants__summoner_id='puuid-0')
+        seen, cursor = [], None
+        while True:
+            matches, cursor = keyset_page(queryset, cursor, per_page=10)
+            seen += [match.match_id for match in matches]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [match.match_id for match in queryset.order_by('-game_start', '-match_id')])
+        self.assertEqual(len(seen), 25)
+        with self.assertRaises(ValueError):
+            decode_cursor('not a cursor')
+
+    def test_paginate_fragment_carries_next_cursor(self):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        cursor = self.client.get(self.url).context['next_cursor']
+        response = self.client.get(self.url, {'section': 'paginate', 'cursor': cursor, 'count': 1}, **headers)
+        self.assertEqual(response['X-Total-Count'], '25')
+        self.assertContains(response, f'data-next-cursor="{response.context["next_cursor"]}"')
+        last = self.client.get(self.url, {'section': 'paginate', 'cursor': response.context['next_cursor']}, **headers)
+        self.assertEqual(len(last.context['matches']), 5)
+        self.assertNotContains(last, 'data-next-cursor')
+        self.assertEqual(self.client.get(self.url, {'section': 'paginate', 'cursor': '!!'}, **headers).status_code, 400)
+
+
+class MatchCardTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        MatchManager('americas', 'na1', None)._persist_batch({'NA1_1': _match_payload('NA1_1'),
+                                                              'NA1_2': _match_payload('NA1_2', game_start=1726000000000)})
+
+    def test_ingestion_writes_cards_and_page_is_one_query(self):
+        self.assertEqual(MatchCard.objects.count(), 2)
+        self.assertEqual(ParticipantCard.objects.count(), 20)
+        with self.assertNumQueries(1):
+            matches, _ = keyset_page(ParticipantCard.objects.filter(summoner_id='puuid-6').select_related('match'))
+            cards = present_cards(matches, patch='14.17.1')
+        self.assertEqual([card['match_id'] for card in cards], ['NA1_2', 'NA1_1'])
+        card = cards[0]
+        self.assertEqual((card['win'], card['kills'], card['kda'], card['cs_min'], card['duration']),
+                         (False, 6, '5.33', '1.0', '20:0'))
+        self.assertEqual(card['champion_url'], 'https://ddragon.leagueoflegends.com/cdn/14.17.1/img/champion/Sona.png')
+        self.assertEqual(card['item_urls'][0], 'https://ddragon.leagueoflegends.com/cdn/14.17.1/img/item/3078.png')
+        self.assertEqual(card['item_urls'][1:], [None] * 5)
+        self.assertEqual([player['main'] for player in card['red_team']], [False, True, False, False, False])
+        self.assertEqual(card['blue_team'][0]['url'], reverse('match_history:details', args=['player0', 'NA1']))
+
+
+    def test_backfill_builds_cards_for_matches_ingested_without_them(self):
+        def cards():
+            return list(ParticipantCard.objects.order_by('summoner_id', 'match_id').values_list('card', flat=True))
+
+        ingested = cards()
+        MatchCard.objects.filter(match_id='NA1_1').delete()
+        self.assertEqual(list(iter_match_chunks(10)), [['NA1_1']])
+        self.assertEqual(sum(build_chunk(chunk) for chunk in iter_match_chunks(10)), 1)
+        self.assertEqual(list(iter_match_chunks(10)), [])
+        self.assertEqual(list(iter_match_chunks(1, missing_only=False)), [['NA1_1'], ['NA1_2']])
+        self.assertEqual(cards(), ingested)
+
+
+class CardFragmentCacheTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        MatchManager('americas', 'na1', None)._persist_batch({'NA1_1': _match_payload('NA1_1')})
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_fragments_are_reused_with_fresh_relative_time(self):
+        def cards():
+            return ParticipantCard.objects.filter(summoner_id='puuid-0').select_related('match')
+
+        first = render_match_cards(cards(), patch='14.17.1')
+        not_rendered = patch('match_history.util.card_fragments.present_cards', side_effect=AssertionError('rendered'))
+        # Cached fragments are served without rendering the card again.
+        with patch('match_history.util.card_fragments.format_time_diff', return_value='just now'), not_rendered:
+            second = render_match_cards(cards(), patch='14.17.1')
+        self.assertIn('/cdn/14.17.1/img/champion/Sona.png', second[0])
+        self.assertEqual(second[0].replace('just now', ''), first[0].replace(Match.objects.get().get_time_diff(), ''))
+        # A new asset patch is a different key, so the card is rendered again.
+        with not_rendered, self.assertRaises(AssertionError):
+            render_match_cards(cards(), patch='14.17.2')
+        # So is a card rewritten by reprocessing or a backfill.
+        card = ParticipantCard.objects.get(summoner_id='puuid-0')
+        card.card['kills'] = 4242
+        card.save()
+        self.assertIn('4242', render_match_cards(cards(), patch='14.17.1')[0])
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        self.manager = MatchManager('americas', 'na1', None)
+        self.manager._persist_batch({'NA1_1': _match_payload('NA1_1')})
+        self.url = reverse('match_history:details', args=['player0', 'NA1'])
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_unchanged_profile_is_not_modified(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            repeat = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+        section = self.client.get(self.url, {'section': 'paginate'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotEqual(section['ETag'], first['ETag'])
+
+        self.manager._persist_batch({'NA1_2': _match_payload('NA1_2', game_start=1726000000000)})
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+
+class TierListTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        Champion.objects.create(champion_id='Lux', name='Lux', title='the Lady of Luminosity', image_path='Lux.png',
+                                splash_image_path='Lux_0.jpg')
+        ChampionStatsPatch.objects.create(champion_id='Sona', patch='14.9', total_played=40, total_wins=30)
+        ChampionStatsPatch.objects.create(champion_id='Lux', patch='14.9', total_played=60, total_wins=30)
+        ChampionStatsPatch.objects.create(champion_id='Lux', patch='14.10', total_played=4, total_wins=4)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_current_patch_window_and_sorting(self):
+        patches, rows = get_tier_list()
+        self.assertEqual(patches, ['14.10'])
+        self.assertEqual([(row['name'], row['win_rate'], row['pick_rate']) for row in rows], [('Lux', 100, 1000)])
+
+        patches, rows = get_tier_list(window=2, sort='confidence')
+        self.assertEqual(patches, ['14.10', '14.9'])
+        self.assertEqual([row['name'] for row in rows], ['Sona', 'Lux'])
+        self.assertAlmostEqual(rows[0]['confidence'], wilson_lower_bound(30, 40) * 100)
+        self.assertEqual(get_tier_list(patch='14.9', sort='games', descending=False)[1][0]['name'], 'Sona')
+        self.assertEqual(get_tier_list(patch='13.1'), ([], []))
+
+    def test_cached_until_next_ingest(self):
+        get_tier_list(patch='14.9')
+        ChampionStatsPatch.objects.filter(champion_id='Sona').update(total_wins=0)
+        with self.assertNumQueries(0):
+            rows = get_tier_list(patch='14.9')[1]
+        self.assertEqual(rows[0]['name'], 'Sona')
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            MatchManager('americas', 'na1', None)._persist_batch({'NA1_1': _match_payload('NA1_1')})
+            # The version only moves once the batch has committed.
+            self.assertEqual(get_tier_list(patch='14.9')[1][0]['name'], 'Sona')
+        self.assertEqual(len(callbacks), 1)
+        patches, rows = get_tier_list()
+        self.assertEqual(patches, ['14.17'])
+        self.assertEqual(rows[0]['games'], 10)
+
+        response = self.client.get(reverse('match_history:champions'), {'patch': '14.9', 'sort': 'name'})
+        self.assertEqual([row['name'] for row in response.context['champion_query']], ['Sona', 'Lux'])
+
+
+class PatchProviderTest(TestCase):
+    def setUp(self):
+        _create_assets()
+        self.champion = Champion.objects.get(champion_id='Sona')
+        self.icon = ProfileIcon.objects.create(profile_id='29', image_path='29.png')
+        self.previous = patch_provider.current()
+        self.addCleanup(publish_patch, self.previous)
+
+    def test_get_url_does_no_io(self):
+        publish_patch('14.18.1')
+        with self.assertNumQueries(0), patch.object(cache, 'get', side_effect=AssertionError('cache read')):
+            self.assertEqual(self.champion.get_url(),
+                             'https://ddragon.leagueoflegends.com/cdn/14.18.1/img/champion/Sona.png')
+            self.assertEqual(self.icon.get_url(),
+                             'https://ddragon.leagueoflegends.com/cdn/14.18.1/img/profileicon/29.png')
+
+    def test_match_cards_use_the_provider_patch(self):
+        MatchManager('americas', 'na1', None)._persist_batch({'NA1_1': _match_payload('NA1_1')})
+        publish_patch('14.18.1')
+        cards = present_cards(ParticipantCard.objects.filter(summoner_id='puuid-0').select_related('match'))
+        self.assertEqual(cards[0]['champion_url'],
+                         'https://ddragon.leagueoflegends.com/cdn/14.18.1/img/champion/Sona.png')
+
+    def test_reload_keeps_patch_when_key_missing(self):
+        publish_patch('14.18.1')
+        cache.set('PATCH', '14.19.1')
+        patch_provider.reload()
+        self.assertEqual(patch_provider.current(), '14.19.1')
+        cache.delete('PATCH')
+        patch_provider.reload()
+        self.assertEqual(patch_provider.current(), '14.19.1')
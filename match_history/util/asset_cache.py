@@ -0,0 +1,64 @@
+import time
+
+from django.core.cache import cache
+
+from match_history.models import Champion, Item, ProfileIcon, SummonerSpell, Rune
+
+ASSET_VERSION_KEY = "ASSET_VERSION"
+
+
+class AssetResolver():
+    """
+    Process-local lookup tables for the static asset models, so ingestion can resolve champions, items, spells,
+    runes and profile icons from match-v5 ids without querying the database. The tables are reloaded whenever the
+    PATCH cache key or the asset version written by populate_assets changes.
+    """
+
+    def __init__(self):
+        self._version = None
+        self._champions = {}
+        self._items = {}
+        self._spells = {}
+        self._runes = {}
+        self._icons = {}
+
+    def _current_version(self):
+        versions = cache.get_many(["PATCH", ASSET_VERSION_KEY])
+        return versions.get("PATCH"), versions.get(ASSET_VERSION_KEY)
+
+    def refresh(self, version=None):
+        self._champions = {champion.champion_id.lower(): champion for champion in Champion.objects.all()}
+        self._items = {item.item_id: item for item in Item.objects.all()}
+        self._spells = {spell.spell_id: spell for spell in SummonerSpell.objects.all()}
+        self._runes = {rune.rune_id: rune for rune in Rune.objects.all()}
+        self._icons = {icon.profile_id: icon for icon in ProfileIcon.objects.all()}
+        self._version = version if version is not None else self._current_version()
+
+    def sync(self):
+        """Reloads the tables if the patch or asset version moved. Costs one cache round-trip when nothing changed."""
+        version = self._current_version()
+        if version != self._version or not self._champions:
+            self.refresh(version)
+
+    def champion(self, champion_name):
+        return self._champions.get(champion_name.lower())
+
+    def item(self, item_id):
+        return self._items.get(str(item_id))
+
+    def spell(self, spell_id):
+        return self._spells.get(int(spell_id))
+
+    def rune(self, rune_id):
+        return self._runes.get(int(rune_id))
+
+    def profile_icon(self, icon_id):
+        return self._icons.get(str(icon_id))
+
+
+assets = AssetResolver()
+
+
+def bump_asset_version():
+    """Marks the asset tables as changed so every process reloads its AssetResolver on the next sync()."""
+    cache.set(ASSET_VERSION_KEY, time.time(), timeout=None)
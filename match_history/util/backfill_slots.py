@@ -0,0 +1,34 @@
+from django.core.cache import cache
+
+from AramGoV2 import settings
+
+SLOT_TIMEOUT = 3600  # seconds; frees the slot of a backfill whose worker died. Chunk tasks refresh it.
+
+
+def _slot_keys():
+    return [f"backfill-slot-{i}" for i in range(settings.MAX_CONCURRENT_BACKFILLS)]
+
+
+def acquire_backfill_slot(owner):
+    """Takes one of the MAX_CONCURRENT_BACKFILLS slots for owner (a task id). Returns False when all are taken."""
+    for key in _slot_keys():
+        if cache.add(key, owner, timeout=SLOT_TIMEOUT) or cache.get(key) == owner:
+            return True
+    return False
+
+
+def refresh_backfill_slot(owner):
+    """
+    Restarts the timeout of owner's slot so a backfill running longer than SLOT_TIMEOUT keeps it. If the slot already
+    expired, owner takes a free one again when there is one. Returns whether owner holds a slot.
+    """
+    for key, slot_owner in cache.get_many(_slot_keys()).items():
+        if slot_owner == owner:
+            cache.touch(key, SLOT_TIMEOUT)
+            return True
+    return acquire_backfill_slot(owner)
+
+
+def release_backfill_slot(owner):
+    slots = cache.get_many(_slot_keys())
+    cache.delete_many([key for key, slot_owner in slots.items() if slot_owner == owner])
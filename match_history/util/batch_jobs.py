@@ -0,0 +1,26 @@
+from multiprocessing import Pool
+
+from django.db import connections
+from django.db.models import QuerySet
+
+
+def iter_chunks(items, chunk_size):
+    """Yields items in lists of chunk_size. A queryset is streamed through a server-side cursor, not loaded whole."""
+    if isinstance(items, QuerySet):
+        items = items.iterator(chunk_size)
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_in_pool(function, jobs, workers):
+    """Yields function(job) for every job as it completes, run across `workers` forked processes."""
+    # Forked workers must open their own database connections.
+    connections.close_all()
+    with Pool(workers) as pool:
+        yield from pool.imap_unordered(function, jobs)
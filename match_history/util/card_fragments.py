@@ -0,0 +1,67 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from match_history.models import format_time_diff
+from match_history.util.match_cards import present_cards
+from match_history.util.patch_provider import patch_provider
+
+CARD_TEMPLATE = 'match_history/match_card.html'
+FRAGMENT_TIMEOUT = 60 * 60 * 24 * 7
+# Stands in for the relative "x minutes ago" time in cached fragments; replaced for every response.
+TIME_DIFF_MARKER = "@@time-diff@@"
+
+_template_version = None
+
+
+def _get_template_version():
+    """Short hash of match_card.html, so editing the template never serves fragments rendered from the old one."""
+    global _template_version
+    if _template_version is None:
+        source = get_template(CARD_TEMPLATE).template.source
+        _template_version = hashlib.sha1(source.encode()).hexdigest()[:8]
+    return _template_version
+
+
+def _card_version(card):
+    """Short hash of everything the fragment is rendered from, so a rewritten card never serves the old HTML."""
+    content = json.dumps([card.card, card.match.duration, card.match.teams], sort_keys=True, separators=(",", ":"))
+    return hashlib.md5(content.encode()).hexdigest()[:12]
+
+
+def _fragment_key(card, patch):
+    return (f"match-card-html:{_get_template_version()}:{patch}:{card.match_id}:{card.summoner_id}:"
+            f"{_card_version(card)}")
+
+
+def render_match_cards(cards, patch=None):
+    """
+    Renders ParticipantCards (with match selected) to HTML fragments. Each fragment is cached under (template version,
+    asset patch, match, perspective puuid, card content hash), so cards rewritten by reprocessing or a backfill get new
+    keys; a page is read with one get_many and only the missing cards are rendered. The relative time is filled in per
+    response.
+    """
+    cards = list(cards)
+    if not cards:
+        return []
+    if patch is None:
+        patch = patch_provider.current()
+    keys = [_fragment_key(card, patch) for card in cards]
+    fragments = cache.get_many(keys)
+
+    missing = [(key, card) for key, card in zip(keys, cards) if key not in fragments]
+    if missing:
+        template = get_template(CARD_TEMPLATE)
+        rendered = {}
+        for (key, _), presented in zip(missing, present_cards([card for _, card in missing], patch=patch)):
+            presented["time_diff"] = TIME_DIFF_MARKER
+            rendered[key] = template.render({"card": presented})
+        cache.set_many(rendered, timeout=FRAGMENT_TIMEOUT)
+        fragments.update(rendered)
+
+    return [mark_safe(fragments[key].replace(TIME_DIFF_MARKER, escape(format_time_diff(card.game_start))))
+            for key, card in zip(keys, cards)]
@@ -0,0 +1,74 @@
+import threading
+from datetime import timedelta
+
+from django.db import connection
+
+from AramGoV2 import settings
+from match_history.models import Summoner
+from match_history.util.frontier import Frontier
+from match_history.util.populate_data import MatchManager
+from match_history.util.summoner_lock import SummonerLock, crawler_owner
+
+
+class Crawler():
+    """
+    Crawls match histories ahead of profile lookups. `concurrency` threads each take the next player from the
+    frontier and backfill them at backfill priority, so the rate limiter keeps headroom for interactive requests.
+    Players whose history is already being parsed (e.g. someone just looked them up) are skipped, as are players
+    another task holds the SummonerLock of.
+    """
+
+    def __init__(self, platform, region, concurrency=None, frontier=None):
+        self._platform = platform
+        self._region = region
+        self._concurrency = concurrency or settings.CRAWLER_CONCURRENCY
+        self._frontier = frontier or Frontier(revisit_after=timedelta(hours=settings.CRAWLER_REVISIT_HOURS))
+        self._lock = threading.Lock()
+        self._remaining = None
+        self.crawled = 0
+
+    def crawl_one(self, puuid):
+        summoner = Summoner.objects.filter(puuid=puuid).first()
+        lock = SummonerLock(puuid, crawler_owner())
+        if summoner is None or summoner.being_parsed or not lock.acquire():
+            self._frontier.mark_visited(puuid)
+            return
+        match_builder = MatchManager(self._platform, self._region, summoner)
+        try:
+            with lock.heartbeat():
+                match_builder.process_matches(mark_parsing=False)
+        except Exception as e:
+            print(f"Crawl of {puuid} failed: {e}")
+            match_builder.finish_backfill(advance_cursor=False, mark_parsing=False)
+        finally:
+            match_builder.release_claims()
+            lock.release()
+            self._frontier.mark_visited(puuid)
+        with self._lock:
+            self.crawled += 1
+
+    def _take(self):
+        with self._lock:
+            if self._remaining is not None:
+                if self._remaining <= 0:
+                    return None
+                self._remaining -= 1
+        puuids = self._frontier.claim(1)
+        return puuids[0] if puuids else None
+
+    def _work(self):
+        try:
+            while (puuid := self._take()) is not None:
+                self.crawl_one(puuid)
+        finally:
+            connection.close()
+
+    def run(self, limit=None):
+        """Crawls until the frontier has nothing due or `limit` players were taken. Returns the number crawled."""
+        self._remaining = limit
+        workers = [threading.Thread(target=self._work, name=f"crawler-{i}") for i in range(self._concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return self.crawled
@@ -0,0 +1,58 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from match_history.models import CrawlFrontier
+
+
+class Frontier():
+    """
+    Persistent queue of puuids for the crawler. Players are added as they show up in ingested matches and are handed
+    out never-crawled first, then least recently crawled, with players seen in more games ahead of the rest. A
+    crawled player only becomes eligible again after `revisit_after`; a claim held longer than `claim_timeout`
+    (e.g. by a crawler that died) is handed out again.
+    """
+
+    def __init__(self, revisit_after=timedelta(hours=24), claim_timeout=timedelta(hours=1)):
+        self._revisit_after = revisit_after
+        self._claim_timeout = claim_timeout
+
+    def discover(self, puuids):
+        """Adds players to the frontier, bumping games_seen once per occurrence in `puuids`."""
+        counts = Counter(puuids)
+        if not counts:
+            return
+        known = set(CrawlFrontier.objects.filter(puuid__in=counts).values_list('puuid', flat=True))
+        CrawlFrontier.objects.bulk_create(
+            [CrawlFrontier(puuid=puuid, games_seen=count) for puuid, count in sorted(counts.items())
+             if puuid not in known],
+            ignore_conflicts=True,
+        )
+        # Almost every player appears once per batch, so this is usually a single UPDATE.
+        by_count = defaultdict(list)
+        for puuid in known:
+            by_count[counts[puuid]].append(puuid)
+        for count, group in by_count.items():
+            CrawlFrontier.objects.filter(puuid__in=group).update(games_seen=F('games_seen') + count)
+
+    def claim(self, count=1):
+        now = timezone.now()
+        with transaction.atomic():
+            puuids = list(
+                CrawlFrontier.objects.select_for_update(skip_locked=True)
+                .filter(Q(last_crawled__isnull=True) | Q(last_crawled__lt=now - self._revisit_after))
+                .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - self._claim_timeout))
+                .order_by(F('last_crawled').asc(nulls_first=True), '-games_seen')
+                .values_list('puuid', flat=True)[:count]
+            )
+            CrawlFrontier.objects.filter(puuid__in=puuids).update(claimed_at=now)
+        return puuids
+
+    def mark_visited(self, puuid):
+        CrawlFrontier.objects.filter(puuid=puuid).update(last_crawled=timezone.now(), claimed_at=None)
+
+    def visited(self, puuid):
+        return CrawlFrontier.objects.filter(puuid=puuid, last_crawled__gte=timezone.now() - self._revisit_after).exists()
@@ -0,0 +1,39 @@
+import base64
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Q
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(match):
+    """Opaque token for the position just after `match` (a Match or ParticipantCard) in newest-first order."""
+    micros = (match.game_start - EPOCH) // timedelta(microseconds=1)
+    return base64.urlsafe_b64encode(f"{micros}:{match.match_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns (game_start, match_id). Raises ValueError for a token encode_cursor did not produce."""
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        micros, match_id = decoded.split(":", 1)
+        return EPOCH + timedelta(microseconds=int(micros)), match_id
+    except (UnicodeDecodeError, OverflowError) as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+
+
+def keyset_page(queryset, cursor=None, per_page=10):
+    """
+    One page of a queryset with game_start and match_id fields (Match, ParticipantCard) in (game_start, match_id)
+    descending order, starting after `cursor`. Seeks on the
+    key instead of counting and OFFSET-scanning, so every page costs the same. Returns (matches, next_cursor), where
+    next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by('-game_start', '-match_id')
+    if cursor:
+        game_start, match_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(game_start__lt=game_start) | Q(game_start=game_start, match_id__lt=match_id))
+    matches = list(queryset[:per_page + 1])
+    if len(matches) > per_page:
+        return matches[:per_page], encode_cursor(matches[per_page - 1])
+    return matches, None
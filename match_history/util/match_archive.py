@@ -0,0 +1,32 @@
+import gzip
+import json
+
+from match_history.models import RawMatch
+from match_history.util.batch_jobs import iter_chunks
+
+
+def pack(match_info: dict):
+    return gzip.compress(json.dumps(match_info, separators=(",", ":")).encode())
+
+
+def unpack(payload):
+    return json.loads(gzip.decompress(bytes(payload)))
+
+
+def archive_matches(match_data: dict):
+    """Stores the raw match-v5 payloads of a batch. The archive is append-only: known match ids are left as they are."""
+    RawMatch.objects.bulk_create(
+        [RawMatch(match_id=match_id, payload=pack(match_info)) for match_id, match_info in match_data.items()],
+        ignore_conflicts=True,
+    )
+
+
+def load_matches(match_ids):
+    """Returns match_id -> match-v5 payload for every archived match in match_ids."""
+    rows = RawMatch.objects.filter(match_id__in=match_ids).values_list("match_id", "payload")
+    return {match_id: unpack(payload) for match_id, payload in rows}
+
+
+def iter_match_id_chunks(chunk_size=200):
+    """Yields the archived match ids in lists of chunk_size, in primary key order."""
+    return iter_chunks(RawMatch.objects.order_by("match_id").values_list("match_id", flat=True), chunk_size)
@@ -0,0 +1,106 @@
+from collections import defaultdict
+
+from match_history.models import Champion, Item, SummonerSpell, Rune, MatchCard, ParticipantCard, Participant, \
+    format_duration, format_time_diff
+from match_history.util.patch_provider import patch_provider
+
+
+def _image(asset):
+    return asset.image_path if asset else None
+
+
+def _url(model, image_path, patch):
+    return model.url_for(image_path, patch) if image_path else None
+
+
+def _participant_card(participant: Participant, game_duration):
+    kda = (participant.kills + participant.assists) / participant.deaths if participant.deaths else 0
+    cs_min = participant.creep_score / (game_duration / 60) if game_duration > 0 else 0
+    return {
+        "win": participant.win,
+        "kills": participant.kills,
+        "deaths": participant.deaths,
+        "assists": participant.assists,
+        "creep_score": participant.creep_score,
+        "kda": f"{kda:.2f}",
+        "cs_min": f"{cs_min:.1f}",
+        "champion": _image(participant.champion),
+        "spells": [_image(participant.spell1), _image(participant.spell2)],
+        "runes": [_image(participant.rune1), _image(participant.rune2)],
+        "items": [_image(getattr(participant, f"item{slot}")) for slot in range(1, 7)],
+    }
+
+
+def write_cards(participants):
+    """
+    Upserts the MatchCard and ParticipantCards of every match the given (unsaved or saved) participants belong to.
+    Everything comes from the in-memory participants and their asset relations, so no reads are needed.
+    """
+    by_match = defaultdict(list)
+    for participant in participants:
+        by_match[participant.match.match_id].append(participant)
+
+    match_cards, participant_cards = [], []
+    for match_id, players in sorted(by_match.items()):
+        match = players[0].match
+        teams = {Participant.BLUE_TEAM: [], Participant.RED_TEAM: []}
+        for participant in players:
+            teams.setdefault(participant.team, []).append({
+                "puuid": participant.summoner.puuid,
+                "game_name": participant.game_name,
+                "url": participant.summoner.get_url(),
+                "champion": _image(participant.champion),
+            })
+        match_card = MatchCard(match=match, duration=format_duration(match.game_duration),
+                               teams=[teams[Participant.BLUE_TEAM], teams[Participant.RED_TEAM]])
+        match_cards.append(match_card)
+        for participant in players:
+            participant_cards.append(ParticipantCard(summoner=participant.summoner, match=match_card,
+                                                     game_start=match.game_start,
+                                                     card=_participant_card(participant, match.game_duration)))
+
+    MatchCard.objects.bulk_create(match_cards, update_conflicts=True, unique_fields=["match"],
+                                  update_fields=["duration", "teams"])
+    participant_cards.sort(key=lambda card: (card.summoner.puuid, card.match.match_id))
+    ParticipantCard.objects.bulk_create(participant_cards, update_conflicts=True, unique_fields=["summoner", "match"],
+                                        update_fields=["game_start", "card"])
+
+
+def present_cards(cards, patch=None):
+    """
+    Turns ParticipantCards (with match selected) into the dicts match_list.html renders. Asset URLs use one patch
+    lookup for the whole page, and the relative "x minutes ago" time is computed now rather than at ingest.
+    """
+    if patch is None:
+        patch = patch_provider.current()
+    presented = []
+    for participant_card in cards:
+        card = participant_card.card
+        teams = []
+        for team in participant_card.match.teams:
+            teams.append([{
+                "game_name": player["game_name"],
+                "url": player["url"],
+                "champion_url": _url(Champion, player["champion"], patch),
+                "main": player["puuid"] == participant_card.summoner_id,
+            } for player in team])
+        presented.append({
+            "match_id": participant_card.match_id,
+            "time_diff": format_time_diff(participant_card.game_start),
+            "duration": participant_card.match.duration,
+            "win": card["win"],
+            "result": "Victory" if card["win"] else "Defeat",
+            "kills": card["kills"],
+            "deaths": card["deaths"],
+            "assists": card["assists"],
+            "creep_score": card["creep_score"],
+            "kda": card["kda"],
+            "cs_min": card["cs_min"],
+            "champion_url": _url(Champion, card["champion"], patch),
+            "spell_urls": [_url(SummonerSpell, image, patch) for image in card["spells"]],
+            "rune_urls": [_url(Rune, image, patch) for image in card["runes"]],
+            "item_urls": [_url(Item, image, patch) for image in card["items"]],
+            "blue_team": teams[0],
+            "red_team": teams[1],
+        })
+    return presented
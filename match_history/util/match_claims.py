@@ -0,0 +1,43 @@
+import uuid
+
+from django.core.cache import cache
+
+CLAIM_TIMEOUT = 300  # seconds; a claim outlives a crashed worker by at most this long
+
+
+def _claim_key(match_id):
+    return f"match-claim-{match_id}"
+
+
+class MatchClaims():
+    """
+    Cross-task claims on match ids, so a match that several tasks want at once is fetched and persisted by only one of
+    them. A claim is an atomic cache add, released once the owner has committed the match or given up on it.
+    """
+
+    def __init__(self, timeout=CLAIM_TIMEOUT):
+        self._owner = uuid.uuid4().hex
+        self._timeout = timeout
+        self._held = set()
+
+    def claim(self, match_ids):
+        """Returns (claimed, skipped): the ids this owner now holds and the ids another task is working on."""
+        claimed, skipped = [], []
+        for match_id in match_ids:
+            if match_id in self._held or cache.add(_claim_key(match_id), self._owner, timeout=self._timeout):
+                self._held.add(match_id)
+                claimed.append(match_id)
+            else:
+                skipped.append(match_id)
+        return claimed, skipped
+
+    def release(self, match_ids):
+        held = [match_id for match_id in match_ids if match_id in self._held]
+        if not held:
+            return
+        owners = cache.get_many([_claim_key(match_id) for match_id in held])
+        cache.delete_many([key for key, owner in owners.items() if owner == self._owner])
+        self._held.difference_update(held)
+
+    def release_all(self):
+        self.release(list(self._held))
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+PATCH_KEY = "PATCH"
+PATCH_CHANNEL = "asset-patch"
+PATCH_TTL = 300  # seconds between reloads from the cache, in case a notification was missed
+
+
+def _redis_client():
+    """A client for the cache's Redis, or None when the cache is not Redis (e.g. in tests)."""
+    cache_settings = settings.CACHES["default"]
+    if not cache_settings["BACKEND"].endswith("RedisCache"):
+        return None
+    return redis.Redis.from_url(cache_settings["LOCATION"])
+
+
+class PatchProvider():
+    """
+    Process-local copy of the ddragon patch used in asset URLs, so get_url() never waits on the cache. current() only
+    reads memory. A background thread reloads the patch every `ttl` seconds and, when the cache is Redis, applies
+    patches announced by publish_patch() as soon as they arrive. The thread is restarted after a fork.
+    """
+
+    def __init__(self, ttl=PATCH_TTL):
+        self._ttl = ttl
+        self._patch = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        if self._pid != os.getpid():
+            self._start()
+        return self._patch
+
+    def set(self, patch):
+        self._patch = patch
+
+    def reload(self):
+        patch = cache.get(PATCH_KEY)
+        if patch:
+            self._patch = patch
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._patch is None:
+                # The only read current() ever waits for: once per process, unless ready() already set the patch.
+                self.reload()
+            self._pid = os.getpid()
+            threading.Thread(target=self._watch, name="patch-provider", daemon=True).start()
+
+    def _watch(self):
+        client = _redis_client()
+        while True:
+            try:
+                if client is None:
+                    time.sleep(self._ttl)
+                    self.reload()
+                    continue
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(PATCH_CHANNEL)
+                deadline = time.monotonic() + self._ttl
+                while True:
+                    message = pubsub.get_message(timeout=max(deadline - time.monotonic(), 0))
+                    if message:
+                        self.set(message["data"].decode())
+                    if time.monotonic() >= deadline:
+                        self.reload()
+                        deadline = time.monotonic() + self._ttl
+            except Exception as e:
+                print(f"Patch watcher lost its connection: {e}")
+                time.sleep(5)
+
+
+patch_provider = PatchProvider()
+
+
+def publish_patch(patch, timeout=None):
+    """Stores the patch in the cache and tells every process's PatchProvider about it."""
+    cache.set(PATCH_KEY, patch, timeout=timeout)
+    patch_provider.set(patch)
+    client = _redis_client()
+    if client is None:
+        return
+    try:
+        client.publish(PATCH_CHANNEL, patch)
+    except redis.RedisError as e:
+        print(f"Could not announce patch {patch}: {e}")
@@ -0,0 +1,72 @@
+import time
+from collections import deque
+
+
+class StageStats():
+    def __init__(self, name):
+        self.name = name
+        self.matches = 0
+        self.seconds = 0.0
+
+    def add(self, matches, seconds):
+        self.matches += matches
+        self.seconds += seconds
+
+    def rate(self):
+        return self.matches / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return f"{self.name}: {self.matches} matches in {self.seconds:.1f}s ({self.rate():.1f}/s)"
+
+
+class MatchPipeline():
+    """
+    Overlaps fetching and persisting of match batches. Up to `depth` batches are being fetched while the current
+    one is written to the database; the next fetch is only submitted once a slot frees up, which keeps memory bounded
+    when the database is the slower stage.
+
+    `submit_fetch(batch)` must return a concurrent.futures.Future resolving to match_id -> payload, and
+    `persist(match_data)` writes one fetched batch.
+    """
+
+    def __init__(self, submit_fetch, persist, depth=2):
+        self._submit_fetch = submit_fetch
+        self._persist = persist
+        self._depth = max(1, depth)
+        self.fetch_stats = StageStats("fetch")
+        self.persist_stats = StageStats("persist")
+        self.fetch_wait = 0.0
+
+    def _submit(self, batch):
+        started = time.monotonic()
+        future = self._submit_fetch(batch)
+        future.add_done_callback(lambda done: self.fetch_stats.add(len(batch), time.monotonic() - started))
+        return batch, future
+
+    def run(self, batches):
+        """Fetches and persists every batch, yielding (batch, match_data) after each one is written."""
+        batches = iter(batches)
+        pending = deque()
+        for batch in batches:
+            pending.append(self._submit(batch))
+            if len(pending) == self._depth:
+                break
+
+        while pending:
+            batch, future = pending.popleft()
+            waited = time.monotonic()
+            match_data = future.result()
+            self.fetch_wait += time.monotonic() - waited
+
+            next_batch = next(batches, None)
+            if next_batch is not None:
+                pending.append(self._submit(next_batch))
+
+            started = time.monotonic()
+            self._persist(match_data)
+            self.persist_stats.add(len(match_data), time.monotonic() - started)
+            yield batch, match_data
+
+    def report(self):
+        bottleneck = "Riot API" if self.fetch_wait > self.persist_stats.seconds else "database"
+        return f"{self.fetch_stats}; {self.persist_stats}; waited {self.fetch_wait:.1f}s on fetches ({bottleneck} bound)"
@@ -1,41 +1,65 @@
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
 
 import django
 from datetime import datetime as dt
 import pytz
-from riotwatcher import LolWatcher, RiotWatcher, ApiError
+from riotwatcher import ApiError
 
 from AramGoV2 import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', "AramGoV2.settings")
 django.setup()
 from match_history.models import *
+from match_history.util.asset_cache import assets
+from match_history.util.stat_aggregator import StatAggregator
+from match_history.util.riot_client import get_fetcher
+from match_history.util.rate_limit import INTERACTIVE, BACKFILL
+from match_history.util.match_archive import archive_matches
+from match_history.util.pipeline import MatchPipeline
+from match_history.util.match_claims import MatchClaims, CLAIM_TIMEOUT
+from match_history.util.progress import ProgressReporter
+from match_history.util.frontier import Frontier
+from match_history.util.profile_snapshot import invalidate_profiles
+from match_history.util.match_cards import write_cards
 
 RIOT_API_KEY = settings.RIOT_API_KEY
 QUEUE = 450  # Aram
 COUNT = 100
+BATCH_SIZE = 20
+INTERACTIVE_CLAIM_WAIT = 3  # seconds an interactive update waits on matches another task has claimed
 from django.db import transaction
 
+MATCH_UPDATE_FIELDS = ["game_start", "game_duration", "game_mode", "game_version", "winner", "new_match"]
+# being_parsed is left alone so ingesting a game never clears the flag of a summoner whose backfill is running.
+SUMMONER_UPDATE_FIELDS = [
+    "game_name", "normalized_game_name", "summoner_name", "tag_line", "normalized_tag_line", "summoner_level",
+    "profile_icon", "last_updated",
+]
+PARTICIPANT_UPDATE_FIELDS = [
+    "champion", "kills", "deaths", "assists", "creep_score", "team", "win", "game_name",
+    "spell1", "spell2", "rune1", "rune2", "item1", "item2", "item3", "item4", "item5", "item6",
+    "snowballs_thrown", "snowball_hits",
+]
+
 
 class SummonerManager():
     def __init__(self, platform=None, region=None):
-        self._lolWatcher = LolWatcher(RIOT_API_KEY)
-        self._riotWatcher = RiotWatcher(RIOT_API_KEY)
+        self._fetcher = get_fetcher()
         self._platform = platform
         self._region = region
         self._base_url = f"https://{platform}.api.riotgames.com"
 
     def _get_puid(self, summoner_name, tag):
         try:
-            account_info = self._riotWatcher.account.by_riot_id(self._platform, summoner_name, tag)
+            account_info = self._fetcher.account_by_riot_id(self._platform, summoner_name, tag, INTERACTIVE)
             return account_info
         except ApiError as err:
             raise ApiError(f"Error fetching PUUID for {summoner_name}#{tag}: {err}")
 
     def _get_account_info(self, puid):
         try:
-            account_info = self._lolWatcher.summoner.by_puuid(self._region, puid)
+            account_info = self._fetcher.summoner_by_puuid(self._region, puid, INTERACTIVE)
             return account_info
         except ApiError as err:
             raise ApiError(f"Failed to fetch account info for PUUID {puid}: {err}")
@@ -47,11 +71,8 @@ class SummonerManager():
         except ApiError as err:
             raise ApiError(f"Error during summoner creation for {summoner_name}#{tag}: {err}") from err
         level = account_info["summonerLevel"]
-        icon_id = account_info["profileIconId"]
-        try:
-            icon = ProfileIcon.objects.get(profile_id=icon_id)
-        except ProfileIcon.DoesNotExist:
-            icon = None
+        assets.sync()
+        icon = assets.profile_icon(account_info["profileIconId"])
         summoner, created = Summoner.objects.update_or_create(
             puuid=account_info["puuid"],
             defaults={
@@ -64,6 +85,7 @@ class SummonerManager():
                 'being_parsed': True
             }
         )
+        invalidate_profiles([summoner.puuid])
         return summoner
 
 
@@ -78,21 +100,33 @@ def _convert_stamp(unix_timestamp):
 
 
 class MatchManager():
-    def __init__(self, platform, region, summoner: Summoner):
-        self._watcher = LolWatcher(RIOT_API_KEY)
+    def __init__(self, platform, region, summoner: Summoner, priority=BACKFILL):
+        self._fetcher = get_fetcher()
         self._platform = platform
         self._region = region
         self._summoner = summoner
+        self._priority = priority
         self._matches = []
         self._processed_matches = 0
-
-    def _get_all(self):
+        self._claims = MatchClaims()
+        self._skipped = []
+
+    def _get_all(self, since=None, stop_at=None):
+        """
+        Pages through the summoner's ARAM matchlist, newest first. `since` limits the list to games started at or
+        after that datetime and paging stops at `stop_at`, the newest match id we already ingested.
+        """
+        start_time = int(since.timestamp()) if since else None
         try:
             match_list = []
             start = 0
             while True:
-                new_matches = self._watcher.match.matchlist_by_puuid(self._region, self._summoner.puuid, queue=QUEUE,
-                                                                     count=COUNT, start=start)
+                new_matches = self._fetcher.matchlist_by_puuid(self._platform, self._summoner.puuid, queue=QUEUE,
+                                                               count=COUNT, start=start, start_time=start_time,
+                                                               priority=self._priority)
+                if stop_at in new_matches:
+                    match_list += new_matches[:new_matches.index(stop_at)]
+                    break
                 match_list += new_matches
                 if len(new_matches) != COUNT:
                     break
@@ -105,237 +139,302 @@ class MatchManager():
         match_list = []
         try:
             start = 0
-            new_matches = self._watcher.match.matchlist_by_puuid(self._region, self._summoner.puuid, queue=QUEUE,count=20, start=start)
+            new_matches = self._fetcher.matchlist_by_puuid(self._platform, self._summoner.puuid, queue=QUEUE, count=20,
+                                                           start=start, priority=self._priority)
             match_list += new_matches
 
             return match_list
         except ApiError as err:
             print(f"API Error: {err}")
 
-    def _get_match_info(self, match_id):
-        try:
-            match_details = self._watcher.match.by_id(self._region, match_id)
-            return match_details
-        except ApiError as err:
-            print(f"Error fetching match info for match ID {match_id}: {err}")
-
-    def _create_match(self, match_id: str, match_info: dict, new=False):
-
+    def _build_match(self, match_id: str, match_info: dict, new=False):
         blue = match_info["teams"][0]["win"]
         winner = 100 if blue is True else 200
 
-        match, created = Match.objects.update_or_create(
+        return Match(
             match_id=match_id,
-            defaults={
-                "game_start": _convert_stamp(match_info["gameStartTimestamp"]),
-                "game_duration": match_info["gameDuration"],
-                "game_mode": match_info["gameMode"],
-                "game_version": match_info["gameVersion"],
-                "winner": winner,
-                "new_match": new
-            }
+            game_start=_convert_stamp(match_info["gameStartTimestamp"]),
+            game_duration=match_info["gameDuration"],
+            game_mode=match_info["gameMode"],
+            game_version=match_info["gameVersion"],
+            winner=winner,
+            new_match=new,
         )
 
-        return match, created
-
-    def create_summoner_match(self, info_dict, game_creation):
-        icon_id = info_dict["profileIcon"]
-        try:
-            icon = ProfileIcon.objects.get(profile_id=icon_id)
-        except ProfileIcon.DoesNotExist:
-
-            icon = None
-        summoner_exist = Summoner.objects.filter(puuid=info_dict["puuid"])
-        if summoner_exist and summoner_exist[0].last_updated and game_creation < summoner_exist[0].last_updated:
-            return summoner_exist[0]
-        summoner, created = Summoner.objects.update_or_create(
-            puuid=info_dict["puuid"],
-            defaults={
-                'game_name': info_dict.get("riotIdGameName", ""),
-                'normalized_game_name': info_dict.get("riotIdGameName", "").replace(" ", "").lower(),
-                'summoner_name': info_dict["summonerName"],
-                'tag_line': info_dict.get("riotIdTagline", ""),
-                'normalized_tag_line': info_dict.get("riotIdTagline", "").replace(" ", "").lower(),
-                'summoner_level': info_dict["summonerLevel"],
-                'profile_icon': icon,
-                'last_updated': game_creation,
-                'being_parsed': False
-            }
+    def _upsert_summoners(self, batch):
+        """
+        Refreshes the Summoner rows of every player in a batch of (match_info, match) pairs. Existing last_updated
+        values are read with one query and only players whose row is older than the game are written, with one
+        upsert. Returns puuid -> Summoner.
+        """
+        newest = {}
+        for match_info, match in batch:
+            for participant_data in match_info["info"]["participants"]:
+                puuid = participant_data["puuid"]
+                if puuid not in newest or newest[puuid][1] < match.game_start:
+                    newest[puuid] = (participant_data, match.game_start)
+
+        last_updated = dict(Summoner.objects.filter(puuid__in=newest).values_list('puuid', 'last_updated'))
+        summoners = {}
+        stale = []
+        for puuid, (info_dict, game_creation) in newest.items():
+            summoner = Summoner(
+                puuid=puuid,
+                game_name=info_dict.get("riotIdGameName", ""),
+                normalized_game_name=info_dict.get("riotIdGameName", "").replace(" ", "").lower(),
+                summoner_name=info_dict["summonerName"],
+                tag_line=info_dict.get("riotIdTagline", ""),
+                normalized_tag_line=info_dict.get("riotIdTagline", "").replace(" ", "").lower(),
+                summoner_level=info_dict["summonerLevel"],
+                profile_icon=assets.profile_icon(info_dict["profileIcon"]),
+                last_updated=game_creation,
+            )
+            summoners[puuid] = summoner
+            if puuid not in last_updated or last_updated[puuid] is None or game_creation >= last_updated[puuid]:
+                stale.append(summoner)
+
+        # Sorted so concurrent batches lock summoner rows in the same order.
+        stale.sort(key=lambda summoner: summoner.puuid)
+        Summoner.objects.bulk_create(
+            stale,
+            update_conflicts=True,
+            unique_fields=["puuid"],
+            update_fields=SUMMONER_UPDATE_FIELDS,
         )
-        return summoner
+        return summoners
 
     def _add_items(self, participant, participant_data):
-        changed = False
         for j in range(6):
             item_id = participant_data[f"item{j}"]
             if item_id != 0:
-                try:
-                    item = Item.objects.get(pk=item_id)
-                    setattr(participant, f"item{j}", item)
-                    changed = True
-                except Item.DoesNotExist:
-                    pass
-        if changed:
-            participant.save()
-
-    def _increment_models(self, participant, match, snowballs):
-        patch = match.get_patch()
-        year = match.game_start.year
-        if participant.game_name.lower() == 'highkeysavage':
-            print(f"{participant.champion} on {match.game_start} year: {year} on site: {match.get_time_diff()}")
-
-        summoner_champ_stats, createad = SummonerChampionStats.objects.update_or_create(
-            summoner=participant.summoner,
-            champion=participant.champion,
-            year=year
+                setattr(participant, f"item{j + 1}", assets.item(item_id))
+
+    def _build_participant(self, participant_data: dict, match: Match, summoner: Summoner):
+        """Builds an unsaved Participant (items included) for one entry of match-v5 info.participants."""
+        champion: Champion = assets.champion(participant_data["championName"])
+        if champion is None:
+            print(f"Champion {participant_data['championName']} not in DB, skipping participant")
+            return None
+        team_id = participant_data["teamId"]
+        win = True if participant_data["win"] is True else False
+        spell1 = assets.spell(participant_data["summoner1Id"])
+        spell2 = assets.spell(participant_data["summoner2Id"])
+        rune1 = assets.rune(participant_data["perks"]["styles"][0]["selections"][0]["perk"])
+        rune2 = assets.rune(participant_data["perks"]["styles"][1]["style"])
+
+        participant = Participant(
+            match=match,
+            summoner=summoner,
+            champion=champion,
+            kills=participant_data["kills"],
+            deaths=participant_data["deaths"],
+            assists=participant_data["assists"],
+            creep_score=participant_data["totalMinionsKilled"],
+            team=team_id,
+            win=win,
+            game_name=participant_data.get("riotIdGameName", participant_data["summonerName"]),
+            spell1=spell1,
+            spell2=spell2,
+            rune1=rune1,
+            rune2=rune2,
         )
-        summoner_champ_stats.update_stats(participant, match)
-
-        account_stats, created = AccountStats.objects.update_or_create(
-            summoner=participant.summoner,
-            year=year
+        self._add_items(participant, participant_data)
+        return participant
+
+    def _get_snowballs(self, participant: Participant, participant_data: dict):
+        total_snowballs = 0
+        if participant.spell1 and participant.spell1.spell_id == 32:
+            total_snowballs = participant_data["summoner1Casts"]
+        elif participant.spell2 and participant.spell2.spell_id == 32:
+            total_snowballs = participant_data["summoner2Casts"]
+        challenges = participant_data.get("challenges", {})
+        snowball_hits = challenges.get('snowballsHit', 0)
+        return snowball_hits, total_snowballs
+
+    def _create_matches(self, match_data: dict, new=False):
+        """Upserts the Match rows of a batch with a single statement. match_data maps match_id -> match-v5 payload."""
+        matches = [self._build_match(match_id, match_info["info"], new) for match_id, match_info in match_data.items()]
+        Match.objects.bulk_create(
+            matches,
+            update_conflicts=True,
+            unique_fields=["match_id"],
+            update_fields=MATCH_UPDATE_FIELDS,
         )
-        account_stats.update_stats(participant, snowballs)
-
-        champ_stats_patch, created = ChampionStatsPatch.objects.update_or_create(
-            champion=participant.champion,
-            patch=patch
+        return matches
+
+    def _create_participants_bulk(self, batch, counted=frozenset()):
+        """
+        Builds every Participant of a batch of (match_info, match) pairs in memory and writes them with one upsert,
+        along with their match cards, then applies the batch's aggregated stat deltas. Matches whose ids are in
+        `counted` are already part of the stat tables and are not added again.
+        """
+        assets.sync()
+        summoners = self._upsert_summoners(batch)
+        participants = []
+        stats = StatAggregator()
+        for match_info, match in batch:
+            for participant_data in match_info["info"]["participants"]:
+                participant = self._build_participant(participant_data, match, summoners[participant_data["puuid"]])
+                if participant is None:
+                    continue
+                snowballs = self._get_snowballs(participant, participant_data)
+                participant.snowball_hits, participant.snowballs_thrown = snowballs
+                participants.append(participant)
+                if match.match_id not in counted:
+                    stats.add(participant, match, snowballs)
+
+        Participant.objects.bulk_create(
+            participants,
+            update_conflicts=True,
+            unique_fields=["match", "summoner"],
+            update_fields=PARTICIPANT_UPDATE_FIELDS,
         )
-        champ_stats_patch.update_stats(participant)
-
-    def _create_participants(self, match_info: dict, match: Match):
-        participants_puid = match_info["metadata"]["participants"]
-
-        for i in range(len(participants_puid)):
-            participant_data = match_info["info"]["participants"][i]
-            summoner: Summoner = self.create_summoner_match(participant_data, match.game_start)
-            try:
-                champion: Champion = Champion.objects.get(champion_id__iexact=participant_data["championName"])
-            except Champion.DoesNotExist:
-                print(f"Champion {participant_data['championName']} not in DB, skipping participant")
-                continue
-            team_id = participant_data["teamId"]
-            win = True if participant_data["win"] is True else False
-            try:
-                spell1 = SummonerSpell.objects.get(spell_id=participant_data["summoner1Id"])
-            except SummonerSpell.DoesNotExist:
-                spell1 = None
-            try:
-                spell2 = SummonerSpell.objects.get(spell_id=participant_data["summoner2Id"])
-            except SummonerSpell.DoesNotExist:
-                spell2 = None
-            try:
-                rune1 = Rune.objects.get(
-                    rune_id=participant_data["perks"]["styles"][0]["selections"][0]["perk"])
-            except Rune.DoesNotExist:
-                rune1 = None
-            try:
-                rune2 = Rune.objects.get(rune_id=participant_data["perks"]["styles"][1]["style"])
-            except Rune.DoesNotExist:
-                rune2 = None
-
-            participant, created = Participant.objects.update_or_create(
-                match=match,
-                summoner=summoner,
-                champion=champion,
-                defaults={
-                    "kills": participant_data["kills"],
-                    "deaths": participant_data["deaths"],
-                    "assists": participant_data["assists"],
-                    "creep_score": participant_data["totalMinionsKilled"],
-                    "team": team_id,
-                    "win": win,
-                    "game_name": participant_data.get("riotIdGameName", participant_data["summonerName"]),
-                    "spell1": spell1,
-                    "spell2": spell2,
-                    "rune1": rune1,
-                    "rune2": rune2,
-                }
-            )
-            total_snowballs = 0
-            if participant.spell1 and participant.spell1.spell_id == 32:
-                total_snowballs = participant_data["summoner1Casts"]
-            elif participant.spell2 and participant.spell2.spell_id == 32:
-                total_snowballs = participant_data["summoner2Casts"]
-            challenges = participant_data.get("challenges", {})
-            snowball_hits = challenges.get('snowballsHit', 0)
-            snowballs = (snowball_hits, total_snowballs)
-
-            self._add_items(participant, participant_data)
-
-            self._increment_models(participant, match, snowballs)
-
-    def _fetch_matches_parallel(self, match_ids, max_workers=8):
-        """Fetch match details from Riot API in parallel."""
-        results = {}
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(self._get_match_info, mid): mid for mid in match_ids}
-            for future in as_completed(futures):
-                match_id = futures[future]
-                try:
-                    data = future.result()
-                    if data:
-                        results[match_id] = data
-                except Exception as e:
-                    print(f"Error fetching {match_id}: {e}")
-        return results
-
-    def process_matches(self, progress_recorder=None):
-        self._matches = self._get_all()
-        if not self._matches:
+        write_cards(participants)
+        stats.flush()
+
+    def _persist_batch(self, match_data: dict, new=False, archive=True):
+        """
+        Writes a batch of match-v5 payloads, their participants and (unless reprocessing from it) the raw archive in
+        one transaction. Stats are only counted for matches that were not in the database yet.
+        """
+        if not match_data:
             return
+        with transaction.atomic():
+            existing = set(Match.objects.filter(match_id__in=match_data).values_list('match_id', flat=True))
+            if archive:
+                archive_matches(match_data)
+            matches = self._create_matches(match_data, new=new)
+            self._create_participants_bulk([(match_data[match.match_id], match) for match in matches], existing)
+        # Outside the transaction: the frontier is only a crawl hint and must not extend the batch's row locks.
+        Frontier().discover([participant["puuid"] for match_id, match_info in match_data.items()
+                             if match_id not in existing for participant in match_info["info"]["participants"]])
+        invalidate_profiles([participant["puuid"] for match_info in match_data.values()
+                             for participant in match_info["info"]["participants"]])
+
+    def _fetch_matches(self, match_ids):
+        """Fetch match details concurrently through the shared async Riot client."""
+        return self._fetcher.fetch_matches(self._platform, match_ids, self._priority)
+
+    def _claim_new(self, match_ids):
+        """
+        Claims match ids for this task. Ids another task is already working on are remembered in self._skipped, and
+        ids that were committed since we last looked are released again.
+        """
+        claimed, skipped = self._claims.claim(match_ids)
+        self._skipped += skipped
+        existing = set(Match.objects.filter(match_id__in=claimed).values_list('match_id', flat=True))
+        self._claims.release(existing)
+        return [match_id for match_id in claimed if match_id not in existing]
+
+    def _submit_fetch(self, match_ids):
+        return self._fetcher.submit_fetch_matches(self._platform, self._claim_new(match_ids), self._priority)
+
+    def release_claims(self):
+        self._claims.release_all()
+
+    def _wait_for_skipped(self, timeout=CLAIM_TIMEOUT, interval=1):
+        """
+        Waits for matches claimed by other tasks to be committed, taking over any whose claim was released or expired
+        without the match being written.
+        """
+        deadline = time.monotonic() + timeout
+        pending, self._skipped = self._skipped, []
+        while pending and time.monotonic() < deadline:
+            existing = set(Match.objects.filter(match_id__in=pending).values_list('match_id', flat=True))
+            pending = [match_id for match_id in pending if match_id not in existing]
+            abandoned = self._claim_new(pending)
+            if abandoned:
+                self._persist_batch(self._fetch_matches(abandoned))
+                self._claims.release(abandoned)
+            pending = self._skipped
+            self._skipped = []
+            if pending:
+                time.sleep(interval)
+
+    def _advance_sync_cursor(self, match_ids=()):
+        """
+        Moves the summoner's sync cursor to the newest match of theirs that is in the database. match_ids is the
+        matchlist that was just ingested, newest first. Matches that failed to fetch are not in the database, and the
+        next sync only asks for games newer than the cursor, so the cursor stops at the newest match older than the
+        oldest missing one (or stays put if there is none).
+        """
+        existing = set(Match.objects.filter(match_id__in=match_ids).values_list('match_id', flat=True))
+        missing = [index for index, match_id in enumerate(match_ids) if match_id not in existing]
+        matches = Match.objects.filter(participants__summoner=self._summoner)
+        if missing:
+            matches = matches.filter(match_id__in=match_ids[missing[-1] + 1:])
+        newest = matches.order_by('-game_start').values_list('match_id', 'game_start').first()
+        if newest:
+            self._summoner.last_match_id, self._summoner.last_match_start = newest
+            self._summoner.save(update_fields=['last_match_id', 'last_match_start'])
+
+    def prepare_backfill(self, progress_recorder=None, mark_parsing=True):
+        """
+        Fetches the summoner's matchlist, records the backfill totals and returns the match ids not in the database yet.
+        Matches that already exist are counted toward progress right away. Crawls pass mark_parsing=False so the
+        profile stays viewable instead of showing a progress bar no task reports to.
+        """
+        incremental = self._summoner.last_match_start is not None
+        self._matches = self._get_all(since=self._summoner.last_match_start, stop_at=self._summoner.last_match_id)
+        if not self._matches:
+            return []
 
         with transaction.atomic():
-            total_matches = len(self._matches)
-            self._summoner.being_parsed = True
+            if incremental:
+                total_matches = self._summoner.parsed_matches + len(self._matches)
+            else:
+                total_matches = len(self._matches)
+                self._summoner.parsed_matches = 0
             self._summoner.total_matches = total_matches
-            self._summoner.save()
+            update_fields = ['parsed_matches', 'total_matches']
+            if mark_parsing:
+                self._summoner.being_parsed = True
+                update_fields.append('being_parsed')
+            self._summoner.save(update_fields=update_fields)
 
         # Filter out matches already in DB
         existing = set(Match.objects.filter(match_id__in=self._matches).values_list('match_id', flat=True))
-        new_match_ids = [m for m in self._matches if m not in existing]
-
-        # Fetch new matches in parallel batches
-        batch_size = 20
-        for batch_start in range(0, len(new_match_ids), batch_size):
-            batch = new_match_ids[batch_start:batch_start + batch_size]
-            match_data = self._fetch_matches_parallel(batch)
-
-            for match_id in batch:
-                if match_id not in match_data:
-                    self._processed_matches += 1
-                    self._summoner.parsed_matches += 1
-                    continue
-                match_info = match_data[match_id]
-                with transaction.atomic():
-                    match_model, created = self._create_match(match_id, match_info["info"])
-                    self._create_participants(match_info, match_model)
-
-                self._processed_matches += 1
-                self._summoner.parsed_matches += 1
-
-                if progress_recorder:
-                    progress_recorder.set_progress(
-                        self._summoner.parsed_matches,
-                        self._summoner.total_matches,
-                        description="matches processed")
-                    self._summoner.save()
-
-        # Count already-existing matches toward progress
-        already_processed = len(existing)
-        self._summoner.parsed_matches += already_processed
-        if progress_recorder and already_processed:
-            progress_recorder.set_progress(
-                self._summoner.total_matches,
-                self._summoner.total_matches,
-                description="matches processed")
-
-        with transaction.atomic():
+        with ProgressReporter(self._summoner, progress_recorder) as progress:
+            progress.advance(len(existing))
+        return [m for m in self._matches if m not in existing]
+
+    def process_match_ids(self, match_ids, progress_recorder=None):
+        """Fetches and persists match_ids; several of these may run at once for one summoner's backfill."""
+        # Fetching batch N+1 overlaps with persisting batch N
+        batches = [match_ids[start:start + BATCH_SIZE] for start in range(0, len(match_ids), BATCH_SIZE)]
+        pipeline = MatchPipeline(self._submit_fetch, self._persist_batch, depth=settings.MATCH_PIPELINE_DEPTH)
+        with ProgressReporter(self._summoner, progress_recorder) as progress:
+            for batch, match_data in pipeline.run(batches):
+                self._claims.release(batch)
+                self._processed_matches += len(batch)
+                progress.advance(len(batch))
+
+            print(f"{self._summoner.puuid}: {pipeline.report()}")
+            self._wait_for_skipped()
+
+    def finish_backfill(self, match_ids=(), advance_cursor=True, mark_parsing=True):
+        """Clears being_parsed and moves the sync cursor past the matches of match_ids that are in the database."""
+        if mark_parsing:
             self._summoner.being_parsed = False
-            self._summoner.save()
+            self._summoner.save(update_fields=['being_parsed'])
+        if advance_cursor:
+            self._advance_sync_cursor(match_ids)
+        invalidate_profiles([self._summoner.puuid])
+
+    def process_matches(self, progress_recorder=None, mark_parsing=True):
+        new_match_ids = self.prepare_backfill(progress_recorder, mark_parsing)
+        if not self._matches:
+            return
+        self.process_match_ids(new_match_ids, progress_recorder)
+        self.finish_backfill(self._matches, mark_parsing=mark_parsing)
 
     def last_20(self, progress_recorder=None):
-        self._matches = self._get_20()
+        # Once a full backfill has set the cursor, everything played since is fetched, not just the newest 20.
+        synced = self._summoner.last_match_start is not None
+        if synced:
+            self._matches = self._get_all(since=self._summoner.last_match_start, stop_at=self._summoner.last_match_id)
+        else:
+            self._matches = self._get_20()
         if not self._matches:
             return
         total_matches = len(self._matches)
@@ -345,27 +444,27 @@ class MatchManager():
         new_match_ids = [m for m in self._matches if m not in existing]
 
         # Fetch all new matches in parallel
-        match_data = self._fetch_matches_parallel(new_match_ids)
+        claimed = self._claim_new(new_match_ids)
+        match_data = self._fetch_matches(claimed)
+        self._persist_batch(match_data, new=True)
+        self._claims.release(claimed)
+        # Matches still claimed after a short wait are left to their owner; the cursor stops before them, so the next
+        # sync picks up any that owner never writes.
+        self._wait_for_skipped(timeout=INTERACTIVE_CLAIM_WAIT)
 
-        for i, match_id in enumerate(new_match_ids):
-            if match_id not in match_data:
-                continue
-            match_info = match_data[match_id]
-            with transaction.atomic():
-                match_model, created = self._create_match(match_id, match_info["info"], new=True)
-                self._create_participants(match_info, match_model)
-            if progress_recorder:
-                progress_recorder.set_progress(i, total_matches, description="matches processed")
+        if synced:
+            self._advance_sync_cursor(self._matches)
+
+        if progress_recorder:
+            progress_recorder.set_progress(len(new_match_ids), total_matches, description="matches processed")
 
 
 
 
 if __name__ == "__main__":
+    from match_history.util.crawler import Crawler
+
     summonerBuilder = SummonerManager("americas", "na1")
     summonertest = summonerBuilder.create_summoner("kittykatmarco", 'na1')
-    matchBuilder = MatchManager("americas", "na1", summonertest)
-    matchBuilder.process_matches()
-    summoners = Summoner.objects.all()
-    for i in range(35):
-        matchMaker = MatchManager("americas", "na1", summoners[i])
-        matchMaker.process_matches()
+    Frontier().discover([summonertest.puuid])
+    Crawler("americas", "na1").run()
@@ -0,0 +1,74 @@
+import hashlib
+import pickle
+import time
+import zlib
+
+from django.core.cache import cache
+from django.utils.http import quote_etag
+
+from match_history.util.asset_cache import ASSET_VERSION_KEY
+from match_history.util.patch_provider import patch_provider
+
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+# Moved by jobs that rewrite every summoner's data at once (e.g. rebuild_stats), instead of each version stamp.
+PROFILE_EPOCH_KEY = "PROFILE_EPOCH"
+# Pages show relative match times, so a validator never outlives this many seconds even if nothing was ingested.
+RELATIVE_TIME_BUCKET = 600
+
+
+def _version_key(puuid):
+    return f"profile-version-{puuid}"
+
+
+def _snapshot_key(puuid):
+    return f"profile-snapshot-{puuid}"
+
+
+def get_profile_version(puuid):
+    return cache.get(_version_key(puuid))
+
+
+def invalidate_profiles(puuids):
+    """Moves the version stamp of every given summoner, so their stored snapshots stop matching."""
+    version = time.time()
+    cache.set_many({_version_key(puuid): version for puuid in set(puuids)}, timeout=None)
+
+
+def bump_profile_epoch():
+    cache.set(PROFILE_EPOCH_KEY, time.time(), timeout=None)
+
+
+def get_profile_validators(puuid, *variant):
+    """
+    Returns (etag, last_modified) for one representation of a summoner's pages, from a single get_many of the
+    summoner's version stamp, the profile epoch and the asset version, plus the patch this process renders with.
+    `variant` distinguishes responses that differ for the same data, such as XHR sections or the parsing state.
+    """
+    stamps = cache.get_many([_version_key(puuid), PROFILE_EPOCH_KEY, ASSET_VERSION_KEY])
+    version = stamps.get(_version_key(puuid))
+    if version is None:
+        version = time.time()
+        cache.add(_version_key(puuid), version, timeout=None)
+    epoch = stamps.get(PROFILE_EPOCH_KEY) or 0
+    bucket = time.time() // RELATIVE_TIME_BUCKET * RELATIVE_TIME_BUCKET
+    tag = repr((puuid, version, epoch, patch_provider.current(), stamps.get(ASSET_VERSION_KEY), bucket) + variant)
+    return quote_etag(hashlib.md5(tag.encode()).hexdigest()), int(max(version, epoch, bucket))
+
+
+def get_profile_snapshot(puuid, build):
+    """
+    Returns the summoner's details-page snapshot, calling build() to make and store a new one when the stored one is
+    missing or older than the version stamp or the profile epoch. A hit is one cache round-trip. The stamps are read
+    before building, so a snapshot built while an ingest was committing is stored under the old version and rebuilt on
+    the next request.
+    """
+    stored = cache.get_many([_version_key(puuid), PROFILE_EPOCH_KEY, _snapshot_key(puuid)])
+    stamp = (stored.get(_version_key(puuid)), stored.get(PROFILE_EPOCH_KEY))
+    snapshot = stored.get(_snapshot_key(puuid))
+    if snapshot is not None and snapshot[0] == stamp:
+        return pickle.loads(zlib.decompress(snapshot[1]))
+
+    data = build()
+    cache.set(_snapshot_key(puuid), (stamp, zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))),
+              timeout=SNAPSHOT_TIMEOUT)
+    return data
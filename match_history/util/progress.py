@@ -0,0 +1,66 @@
+import time
+
+from celery_progress.backend import ProgressRecorder
+from django.db.models import F
+
+from match_history.models import Summoner
+
+
+class ProgressReporter():
+    """
+    Coalesces per-match progress into occasional writes: the Celery progress meta and Summoner.parsed_matches are
+    written at most once every `interval` seconds or `every` matches, and always on close(). parsed_matches is
+    incremented in the database, so several chunk tasks of one backfill can report into the same row.
+    """
+
+    def __init__(self, summoner: Summoner, progress_recorder=None, interval=2.0, every=200):
+        self._summoner = summoner
+        self._progress_recorder = progress_recorder
+        self._interval = interval
+        self._every = every
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def advance(self, count=1):
+        if not count:
+            return
+        self._summoner.parsed_matches += count
+        self._pending += count
+        if self._pending >= self._every or time.monotonic() - self._last_flush >= self._interval:
+            self.flush()
+
+    def flush(self):
+        summoner = Summoner.objects.filter(pk=self._summoner.pk)
+        summoner.update(parsed_matches=F('parsed_matches') + self._pending)
+        self._summoner.parsed_matches = summoner.values_list('parsed_matches', flat=True).get()
+        if self._progress_recorder:
+            self._progress_recorder.set_progress(
+                self._summoner.parsed_matches,
+                self._summoner.total_matches,
+                description="matches processed")
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._pending:
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _RootTask():
+    def __init__(self, task, root_id):
+        self._task = task
+        self._root_id = root_id
+
+    def update_state(self, state, meta):
+        self._task.update_state(task_id=self._root_id, state=state, meta=meta)
+
+
+def root_progress_recorder(task, root_id):
+    """A celery-progress recorder that reports on root_id, the task the progress bar polls, instead of `task`."""
+    return ProgressRecorder(_RootTask(task, root_id))
@@ -0,0 +1,181 @@
+import asyncio
+import collections
+import math
+import threading
+import time
+import uuid
+
+import redis
+
+from AramGoV2 import settings
+
+INTERACTIVE = "interactive"
+BACKFILL = "backfill"
+
+# Method limits for a production key. Both these and the application limits are replaced by whatever Riot
+# reports in the X-App-Rate-Limit / X-Method-Rate-Limit headers.
+DEFAULT_METHOD_LIMITS = {
+    "account-v1.by-riot-id": "1000:60",
+    "summoner-v4.by-puuid": "1600:60",
+    "match-v5.matchlist": "2000:10",
+    "match-v5.match": "2000:10",
+}
+
+_ACQUIRE_SCRIPT = """
+local blocked = redis.call('PTTL', KEYS[#KEYS])
+if blocked > 0 then
+    return tostring(blocked / 1000)
+end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local reserve = tonumber(ARGV[1])
+local wait = 0
+for i = 1, #KEYS - 1 do
+    local capacity = tonumber(ARGV[i * 2])
+    local period = tonumber(ARGV[i * 2 + 1])
+    local allowed = math.max(1, math.floor(capacity * (1 - reserve)))
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - period)
+    local used = redis.call('ZCARD', KEYS[i])
+    if used >= allowed then
+        local oldest = redis.call('ZRANGE', KEYS[i], used - allowed, used - allowed, 'WITHSCORES')
+        wait = math.max(wait, tonumber(oldest[2]) + period - now)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i = 1, #KEYS - 1 do
+    local period = tonumber(ARGV[i * 2 + 1])
+    redis.call('ZADD', KEYS[i], now, now .. ':' .. ARGV[#ARGV])
+    redis.call('EXPIRE', KEYS[i], math.ceil(period) + 1)
+end
+return '0'
+"""
+
+
+def parse_limits(header):
+    """Parses a Riot limit header such as "20:1,100:120" into [(20, 1), (100, 120)]."""
+    limits = []
+    for window in header.split(","):
+        count, seconds = window.strip().split(":")
+        limits.append((int(count), int(seconds)))
+    return limits
+
+
+class RedisBucketStore():
+    """
+    Sliding-window request logs kept in Redis so every web and Celery process draws from the same budget. No
+    window of `period` seconds ever holds more than `count` requests, whichever moment Riot starts its window at.
+    """
+
+    def __init__(self, client: redis.Redis, prefix="riot-ratelimit"):
+        self._client = client
+        self._prefix = prefix
+        self._acquire = client.register_script(_ACQUIRE_SCRIPT)
+
+    def acquire(self, scope, buckets, reserve):
+        """Records one request in every window, or none. Returns 0 on success, otherwise the seconds to wait."""
+        keys = [f"{self._prefix}:{key}:log" for key, _, _ in buckets] + [f"{self._prefix}:{scope}:blocked"]
+        args = [reserve]
+        for _, capacity, period in buckets:
+            args += [capacity, period]
+        args.append(uuid.uuid4().hex)
+        return float(self._acquire(keys=keys, args=args))
+
+    def block(self, scope, seconds):
+        self._client.set(f"{self._prefix}:{scope}:blocked", 1, px=int(seconds * 1000))
+
+
+class LocalBucketStore():
+    """In-process equivalent of RedisBucketStore for tests and single-process development."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._blocked = {}
+
+    def acquire(self, scope, buckets, reserve):
+        with self._lock:
+            now = self._clock()
+            blocked = self._blocked.get(scope, 0) - now
+            if blocked > 0:
+                return blocked
+            wait = 0
+            for key, capacity, period in buckets:
+                window = self._windows.setdefault(key, collections.deque())
+                while window and window[0] <= now - period:
+                    window.popleft()
+                allowed = max(1, math.floor(capacity * (1 - reserve)))
+                if len(window) >= allowed:
+                    wait = max(wait, window[len(window) - allowed] + period - now)
+            if wait > 0:
+                return wait
+            for key, _, _ in buckets:
+                self._windows[key].append(now)
+            return 0
+
+    def block(self, scope, seconds):
+        with self._lock:
+            self._blocked[scope] = self._clock() + seconds
+
+
+class RateLimitScheduler():
+    """
+    Hands out Riot request slots against the application and per-method limits of each routing host. Backfill
+    requests leave `backfill_reserve` of every window untouched so interactive lookups are served first.
+    """
+
+    def __init__(self, store, app_limits, method_limits=None, backfill_reserve=0.2):
+        self._store = store
+        self._app_limits = parse_limits(app_limits)
+        self._method_limits = {method: parse_limits(limits)
+                               for method, limits in (method_limits or DEFAULT_METHOD_LIMITS).items()}
+        self._backfill_reserve = backfill_reserve
+
+    def _buckets(self, host, method):
+        buckets = [(f"{host}:app:{period}", count, period) for count, period in self._app_limits]
+        buckets += [(f"{host}:{method}:{period}", count, period)
+                    for count, period in self._method_limits.get(method, [])]
+        return buckets
+
+    def delay(self, host, method, priority=BACKFILL):
+        reserve = self._backfill_reserve if priority == BACKFILL else 0
+        return self._store.acquire(host, self._buckets(host, method), reserve)
+
+    async def acquire(self, host, method, priority=BACKFILL):
+        """
+        Async version of acquire_blocking. The store call is a blocking Redis round-trip, so it runs in the loop's
+        executor rather than stalling every other request in flight on the loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            wait = await loop.run_in_executor(None, self.delay, host, method, priority)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self, host, method, priority=BACKFILL):
+        while True:
+            wait = self.delay(host, method, priority)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def update_from_response(self, host, method, status, headers):
+        """Adopts the limits Riot reports for this key and backs off on 429s."""
+        if headers.get("X-App-Rate-Limit"):
+            self._app_limits = parse_limits(headers["X-App-Rate-Limit"])
+        if headers.get("X-Method-Rate-Limit"):
+            self._method_limits[method] = parse_limits(headers["X-Method-Rate-Limit"])
+        if status == 429:
+            self._store.block(host, float(headers.get("Retry-After", 1)))
+
+
+def get_scheduler():
+    if settings.RIOT_RATE_LIMIT_STORE == "local":
+        store = LocalBucketStore()
+    else:
+        store = RedisBucketStore(redis.Redis.from_url(settings.CACHES["default"]["LOCATION"]))
+    return RateLimitScheduler(store, settings.RIOT_APP_RATE_LIMITS,
+                              backfill_reserve=settings.RIOT_BACKFILL_RESERVE)
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import threading
+from urllib.parse import quote
+
+import aiohttp
+from riotwatcher import ApiError
+
+from AramGoV2 import settings
+from match_history.util.rate_limit import BACKFILL, get_scheduler
+
+RIOT_BASE_URL = "https://{host}.api.riotgames.com"
+
+
+class RiotApiError(ApiError):
+    """Raised for non-2xx Riot responses. Subclasses riotwatcher's ApiError so existing handlers keep working."""
+
+    def __init__(self, status, url, message=""):
+        super().__init__(f"{status} for {url}: {message}")
+        self.status = status
+        self.url = url
+
+
+class AsyncRiotClient():
+    """
+    asyncio client for the Riot endpoints we use. One aiohttp session (and its connection pool) is shared by every
+    request made through the client; `concurrency` caps how many requests are in flight at once. When a
+    RateLimitScheduler is given, every request first takes a slot from it and 429s are retried once it allows.
+    """
+
+    def __init__(self, api_key, concurrency=100, base_url=RIOT_BASE_URL, timeout=10, scheduler=None, retries=3):
+        self._api_key = api_key
+        self._concurrency = concurrency
+        self._base_url = base_url
+        self._scheduler = scheduler
+        self._retries = retries
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+        self._semaphore = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._concurrency, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self._timeout,
+                headers={"X-Riot-Token": self._api_key or ""},
+            )
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self._session
+
+    async def _get(self, host, method, path, params=None, priority=BACKFILL):
+        session = self._get_session()
+        url = self._base_url.format(host=host) + path
+        if params:
+            params = {key: value for key, value in params.items() if value is not None}
+        for attempt in range(self._retries + 1):
+            if self._scheduler is not None:
+                await self._scheduler.acquire(host, method, priority)
+            async with self._semaphore:
+                async with session.get(url, params=params) as response:
+                    if self._scheduler is not None:
+                        self._scheduler.update_from_response(host, method, response.status, response.headers)
+                    retry_after = float(response.headers.get("Retry-After", 1))
+                    if response.status == 429 and attempt < self._retries:
+                        pass
+                    elif response.status >= 400:
+                        raise RiotApiError(response.status, url, await response.text())
+                    else:
+                        return await response.json()
+            if self._scheduler is None:
+                await asyncio.sleep(retry_after)
+
+    async def account_by_riot_id(self, host, game_name, tag_line, priority=BACKFILL):
+        return await self._get(host, "account-v1.by-riot-id",
+                               f"/riot/account/v1/accounts/by-riot-id/{quote(game_name)}/{quote(tag_line)}",
+                               priority=priority)
+
+    async def summoner_by_puuid(self, host, puuid, priority=BACKFILL):
+        return await self._get(host, "summoner-v4.by-puuid", f"/lol/summoner/v4/summoners/by-puuid/{puuid}",
+                               priority=priority)
+
+    async def matchlist_by_puuid(self, host, puuid, queue=None, start=None, count=None, start_time=None,
+                                 priority=BACKFILL):
+        params = {"queue": queue, "start": start, "count": count, "startTime": start_time}
+        return await self._get(host, "match-v5.matchlist", f"/lol/match/v5/matches/by-puuid/{puuid}/ids", params,
+                               priority=priority)
+
+    async def match_by_id(self, host, match_id, priority=BACKFILL):
+        return await self._get(host, "match-v5.match", f"/lol/match/v5/matches/{match_id}", priority=priority)
+
+    async def fetch_matches(self, host, match_ids, priority=BACKFILL):
+        """Fetches every match concurrently. Returns match_id -> payload, leaving out matches that failed."""
+        responses = await asyncio.gather(*(self.match_by_id(host, match_id, priority) for match_id in match_ids),
+                                         return_exceptions=True)
+        results = {}
+        for match_id, response in zip(match_ids, responses):
+            if isinstance(response, Exception):
+                print(f"Error fetching {match_id}: {response}")
+            elif response:
+                results[match_id] = response
+        return results
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class RiotFetcher():
+    """
+    Synchronous adapter around AsyncRiotClient for the Django/Celery code. The client lives on an event loop running
+    in a background thread, so its connection pool survives across batches and MatchManager instances.
+    """
+
+    def __init__(self, client: AsyncRiotClient):
+        self._client = client
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="riot-fetcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, coroutine):
+        """Schedules a coroutine on the fetcher loop and returns a concurrent.futures.Future for it."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def run(self, coroutine):
+        return self.submit(coroutine).result()
+
+    def account_by_riot_id(self, host, game_name, tag_line, priority=BACKFILL):
+        return self.run(self._client.account_by_riot_id(host, game_name, tag_line, priority))
+
+    def summoner_by_puuid(self, host, puuid, priority=BACKFILL):
+        return self.run(self._client.summoner_by_puuid(host, puuid, priority))
+
+    def matchlist_by_puuid(self, host, puuid, **params):
+        return self.run(self._client.matchlist_by_puuid(host, puuid, **params))
+
+    def fetch_matches(self, host, match_ids, priority=BACKFILL):
+        return self.run(self._client.fetch_matches(host, match_ids, priority))
+
+    def submit_fetch_matches(self, host, match_ids, priority=BACKFILL):
+        return self.submit(self._client.fetch_matches(host, match_ids, priority))
+
+    def close(self):
+        self.run(self._client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+_fetcher = None
+_fetcher_pid = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    """Returns the process-wide RiotFetcher, creating a new one after a fork (e.g. in Celery prefork children)."""
+    global _fetcher, _fetcher_pid
+    with _fetcher_lock:
+        if _fetcher is None or _fetcher_pid != os.getpid():
+            client = AsyncRiotClient(settings.RIOT_API_KEY, concurrency=settings.RIOT_API_CONCURRENCY,
+                                     scheduler=get_scheduler())
+            _fetcher = RiotFetcher(client)
+            _fetcher_pid = os.getpid()
+        return _fetcher
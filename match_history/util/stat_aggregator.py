@@ -0,0 +1,123 @@
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from match_history.models import SummonerChampionStats, AccountStats, ChampionStatsPatch, Participant, Match, \
+    TeammateStats
+
+from match_history.util.tier_list import bump_champion_stats_version
+
+UPSERT_BATCH = 500
+SUMMONER_CHAMPION_COUNTERS = ("total_played", "duration_played", "total_creep_score", "total_wins", "total_losses",
+                              "total_kills", "total_deaths", "total_assists")
+ACCOUNT_COUNTERS = ("total_played", "total_wins", "total_losses", "total_kills", "total_deaths", "total_assists",
+                    "snowball_hits", "snowballs_thrown")
+CHAMPION_PATCH_COUNTERS = ("total_played", "total_wins", "total_losses")
+
+
+class StatAggregator():
+    """
+    Collects per-key counter deltas for SummonerChampionStats, AccountStats, ChampionStatsPatch and TeammateStats
+    across a batch of participants, then applies each table's deltas with batched INSERT ... ON CONFLICT DO UPDATE
+    statements that add them to the stored counts. Increments happen in the database, so concurrent workers touching
+    the same row never overwrite each other's counts, and a key costs the same whether its row exists yet or not.
+    """
+
+    def __init__(self):
+        self._summoner_champion = defaultdict(lambda: defaultdict(int))
+        self._account = defaultdict(lambda: defaultdict(int))
+        self._champion_patch = defaultdict(lambda: defaultdict(int))
+        self._teams = defaultdict(list)
+
+    def add(self, participant: Participant, match: Match, snowballs):
+        year = match.game_start.year
+        wins = 1 if participant.win else 0
+        losses = 1 - wins
+
+        champion_deltas = self._summoner_champion[(participant.summoner_id, participant.champion_id, year)]
+        champion_deltas["total_played"] += 1
+        champion_deltas["duration_played"] += match.game_duration
+        champion_deltas["total_creep_score"] += participant.creep_score
+        champion_deltas["total_wins"] += wins
+        champion_deltas["total_losses"] += losses
+        champion_deltas["total_kills"] += participant.kills
+        champion_deltas["total_deaths"] += participant.deaths
+        champion_deltas["total_assists"] += participant.assists
+
+        account_deltas = self._account[(participant.summoner_id, year)]
+        account_deltas["total_played"] += 1
+        account_deltas["total_wins"] += wins
+        account_deltas["total_losses"] += losses
+        account_deltas["total_kills"] += participant.kills
+        account_deltas["total_deaths"] += participant.deaths
+        account_deltas["total_assists"] += participant.assists
+        account_deltas["snowball_hits"] += snowballs[0]
+        account_deltas["snowballs_thrown"] += snowballs[1]
+
+        patch_deltas = self._champion_patch[(participant.champion_id, match.get_patch())]
+        patch_deltas["total_played"] += 1
+        patch_deltas["total_wins"] += wins
+        patch_deltas["total_losses"] += losses
+
+        self._teams[(match.match_id, participant.team)].append((participant.summoner_id, wins, match.game_start))
+
+    def _teammate_deltas(self):
+        deltas = {}
+        for players in self._teams.values():
+            for summoner_id, wins, game_start in players:
+                month = game_start.date().replace(day=1)
+                for teammate_id, _, _ in players:
+                    if teammate_id == summoner_id:
+                        continue
+                    games, total_wins, last_played = deltas.get((summoner_id, month, teammate_id), (0, 0, game_start))
+                    deltas[(summoner_id, month, teammate_id)] = (games + 1, total_wins + wins,
+                                                                 max(last_played, game_start))
+        return deltas
+
+    def flush(self):
+        """Applies the collected deltas. Keys are applied in sorted order so concurrent flushes lock rows consistently."""
+        _upsert(SummonerChampionStats, ("summoner_id", "champion_id", "year"), SUMMONER_CHAMPION_COUNTERS,
+                _counter_rows(self._summoner_champion, SUMMONER_CHAMPION_COUNTERS))
+        _upsert(AccountStats, ("summoner_id", "year"), ACCOUNT_COUNTERS,
+                _counter_rows(self._account, ACCOUNT_COUNTERS))
+        _upsert(ChampionStatsPatch, ("champion_id", "patch"), CHAMPION_PATCH_COUNTERS,
+                _counter_rows(self._champion_patch, CHAMPION_PATCH_COUNTERS))
+        if self._champion_patch:
+            # After commit: a tier list read before then would cache the old rows under the new version.
+            transaction.on_commit(bump_champion_stats_version)
+        _upsert(TeammateStats, ("summoner_id", "month", "teammate_id"), ("games", "wins"),
+                sorted(self._teammate_deltas().items()), latest=("last_played",))
+
+        self._summoner_champion.clear()
+        self._account.clear()
+        self._champion_patch.clear()
+        self._teams.clear()
+
+
+def _counter_rows(deltas_by_key, counters):
+    return [(key, tuple(deltas[counter] for counter in counters)) for key, deltas in sorted(deltas_by_key.items())]
+
+
+def _upsert(model, key_fields, counters, rows, latest=()):
+    """
+    Adds rows, sorted (key, values) pairs in key_fields and counters + latest order, to model's stored counts with one
+    INSERT ... ON CONFLICT DO UPDATE per UPSERT_BATCH keys. `latest` fields keep the larger of the two values instead.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = [quote(model._meta.get_field(name).column) for name in key_fields + counters + latest]
+    keys = columns[:len(key_fields)]
+    updates = [f"{column} = {table}.{column} + excluded.{column}"
+               for column in columns[len(key_fields):len(key_fields) + len(counters)]]
+    updates += [f"{column} = CASE WHEN excluded.{column} > {table}.{column} THEN excluded.{column} "
+                f"ELSE {table}.{column} END" for column in columns[len(key_fields) + len(counters):]]
+    row_placeholders = f"({', '.join(['%s'] * len(columns))})"
+    for start in range(0, len(rows), UPSERT_BATCH):
+        batch = rows[start:start + UPSERT_BATCH]
+        params = [value for key, values in batch for value in key + values]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row_placeholders] * len(batch))} "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}",
+                params,
+            )
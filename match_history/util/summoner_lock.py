@@ -0,0 +1,110 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+
+LOCK_TIMEOUT = 300  # seconds; a lock outlives a crashed worker by at most this long
+# seconds; how long a lock is kept for a task that is queued rather than running, covering its wait for a worker
+QUEUED_LOCK_TIMEOUT = 60 * 60 * 2
+CRAWLER_OWNER_PREFIX = "crawler-"  # lock owners that are not Celery tasks, so there is nothing to poll
+
+
+def _lock_key(summoner_id):
+    return f"summoner-task-{summoner_id}"
+
+
+class SummonerLockHeld(Exception):
+    """Raised when a task starts work on a summoner whose lock belongs to another task."""
+
+
+class SummonerLock():
+    """
+    At most one parse (backfill, update or crawl) per summoner at a time. The lock is a cache key holding the owner's
+    task id. It expires after `timeout` unless its holder keeps it alive with heartbeat(), so a worker that dies
+    mid-task frees the summoner again without anyone having to clean up after it. Work queued under the lock's owner
+    (the task itself, a retry, chunk tasks) is covered by hand_off() until a worker picks it up.
+    """
+
+    def __init__(self, summoner_id, owner, timeout=LOCK_TIMEOUT):
+        self._key = _lock_key(summoner_id)
+        self._owner = owner
+        self._timeout = timeout
+
+    def acquire(self, timeout=None):
+        """Takes the lock, or refreshes it if this owner already holds it. Returns False if someone else holds it."""
+        timeout = timeout or self._timeout
+        if cache.add(self._key, self._owner, timeout=timeout):
+            return True
+        if cache.get(self._key) == self._owner:
+            cache.touch(self._key, timeout)
+            return True
+        return False
+
+    def hand_off(self, timeout=QUEUED_LOCK_TIMEOUT):
+        """Keeps the lock for `timeout` while work queued under this owner waits for a worker."""
+        return self.acquire(timeout)
+
+    def holder(self):
+        return cache.get(self._key)
+
+    def release(self):
+        if cache.get(self._key) == self._owner:
+            cache.delete(self._key)
+
+    def heartbeat(self):
+        return _Heartbeat(self)
+
+
+class _Heartbeat():
+    """
+    Context manager that re-acquires the lock every third of its timeout while the block runs. Entering raises
+    SummonerLockHeld if another task holds the lock, so the block never runs without it.
+    """
+
+    def __init__(self, lock: SummonerLock):
+        self._lock = lock
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name="summoner-lock-heartbeat", daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(self._lock._timeout / 3):
+            self._lock.acquire()
+
+    def __enter__(self):
+        if not self._lock.acquire():
+            raise SummonerLockHeld(f"{self._lock._key} is held by {self._lock.holder()}")
+        self._thread.start()
+        return self._lock
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def crawler_owner():
+    return f"{CRAWLER_OWNER_PREFIX}{uuid.uuid4().hex}"
+
+
+def enqueue_for_summoner(task, summoner_id, **options):
+    """
+    Enqueues task(summoner_id) unless a parse of this summoner is already in flight. The lock is taken under the new
+    task's id before it is sent, so two concurrent callers can never both enqueue. Returns (task_id, enqueued); when
+    nothing was enqueued task_id is the id of the Celery task already running, or None if the summoner is busy with
+    something that cannot be polled (a crawl).
+    """
+    task_id = uuid.uuid4().hex
+    lock = SummonerLock(summoner_id, task_id, timeout=QUEUED_LOCK_TIMEOUT)
+    for _ in range(3):
+        if lock.acquire():
+            try:
+                task.apply_async((summoner_id,), task_id=task_id, **options)
+            except Exception:
+                lock.release()
+                raise
+            return task_id, True
+        holder = lock.holder()
+        if holder is not None:
+            return (None if holder.startswith(CRAWLER_OWNER_PREFIX) else holder), False
+        # The lock expired between our add and get; try again.
+    return None, False
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from match_history.models import Summoner, TeammateStats
+
+
+def top_teammates(summoner, limit=7, days=None, min_games=2):
+    """
+    The summoner's most frequent teammates, most games together first. `days` limits the window to games played since
+    the start of the month `days` ago (TeammateStats is bucketed by month); None means every game on record. Returns
+    dicts shaped for recent_list.html.
+    """
+    rows = TeammateStats.objects.filter(summoner=summoner)
+    if days is not None:
+        rows = rows.filter(month__gte=(timezone.now() - timedelta(days=days)).date().replace(day=1))
+    rows = list(rows.values('teammate_id')
+                .annotate(total_games=Sum('games'), total_wins=Sum('wins'), latest=Max('last_played'))
+                .filter(total_games__gte=min_games)
+                .order_by('-total_games', '-latest', 'teammate_id')[:limit])
+    teammates = Summoner.objects.select_related('profile_icon').in_bulk([row['teammate_id'] for row in rows])
+
+    recent_stats = []
+    for row in rows:
+        recent_stats.append({
+            'participant': teammates[row['teammate_id']],
+            'total_wins': row['total_wins'],
+            'total_losses': row['total_games'] - row['total_wins'],
+            'winrate': int(round(row['total_wins'] / row['total_games'] * 100)),
+            'last_played': row['latest'],
+        })
+    return recent_stats
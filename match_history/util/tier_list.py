@@ -0,0 +1,105 @@
+import math
+
+from django.core.cache import cache
+from django.db.models import Sum
+
+from match_history.models import Champion, ChampionStatsPatch
+
+CHAMPION_STATS_VERSION_KEY = "CHAMPION_STATS_VERSION"
+TIER_LIST_TIMEOUT = 60 * 60 * 24
+WILSON_Z = 1.96  # 95% confidence
+SORT_KEYS = {
+    "win_rate": lambda row: row["win_rate"],
+    "pick_rate": lambda row: row["pick_rate"],
+    "games": lambda row: row["games"],
+    "confidence": lambda row: row["confidence"],
+    "name": lambda row: row["name"].lower(),
+}
+
+
+def bump_champion_stats_version():
+    """Called after ChampionStatsPatch changes; every cached tier list and patch list stops matching."""
+    try:
+        cache.incr(CHAMPION_STATS_VERSION_KEY)
+    except ValueError:
+        cache.add(CHAMPION_STATS_VERSION_KEY, 1, timeout=None)
+
+
+def _patch_key(patch):
+    return tuple(int(part) if part.isdigit() else 0 for part in patch.split("."))
+
+
+def wilson_lower_bound(wins, games, z=WILSON_Z):
+    """Lower end of the Wilson score interval for the win rate: high only when the sample backs the win rate up."""
+    if games == 0:
+        return 0.0
+    rate = wins / games
+    centre = rate + z * z / (2 * games)
+    margin = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games))
+    return (centre - margin) / (1 + z * z / games)
+
+
+def available_patches(version=None):
+    """Every patch with champion stats, newest first. New patches show up as soon as their first games are ingested."""
+    if version is None:
+        version = cache.get(CHAMPION_STATS_VERSION_KEY, 0)
+    key = f"tier-list-patches:{version}"
+    patches = cache.get(key)
+    if patches is None:
+        patches = sorted(set(ChampionStatsPatch.objects.values_list("patch", flat=True)), key=_patch_key, reverse=True)
+        cache.set(key, patches, timeout=TIER_LIST_TIMEOUT)
+    return patches
+
+
+def resolve_patches(patch=None, window=1, version=None):
+    """The patches a request covers: `window` consecutive patches ending at `patch` (default: the newest one)."""
+    patches = available_patches(version)
+    if patch is None:
+        start = 0
+    elif patch in patches:
+        start = patches.index(patch)
+    else:
+        return []
+    return patches[start:start + max(window, 1)]
+
+
+def _compute(patches):
+    rows = list(ChampionStatsPatch.objects.filter(patch__in=patches).values("champion_id")
+                .annotate(games=Sum("total_played"), wins=Sum("total_wins")))
+    # Ten picks per ARAM game.
+    total_games = sum(row["games"] for row in rows) / 10
+    champions = {champion.champion_id: champion for champion in Champion.objects.filter(
+        champion_id__in=[row["champion_id"] for row in rows]).only("champion_id", "name", "image_path")}
+    tier_list = []
+    for row in rows:
+        champion = champions[row["champion_id"]]
+        tier_list.append({
+            "champion_id": row["champion_id"],
+            "name": champion.name,
+            "image_path": champion.image_path,
+            "games": row["games"],
+            "wins": row["wins"],
+            "win_rate": row["wins"] / row["games"] * 100 if row["games"] else 0,
+            "pick_rate": row["games"] / total_games * 100 if total_games else 0,
+            "confidence": wilson_lower_bound(row["wins"], row["games"]) * 100,
+        })
+    return tier_list
+
+
+def get_tier_list(patch=None, window=1, sort="win_rate", descending=True):
+    """
+    Win rate, pick rate and confidence (Wilson lower bound of the win rate) per champion over the resolved patches,
+    sorted server-side. Returns (patches, rows). Rows are cached per patch set until the next ingested batch moves the
+    champion stats version, and sorting happens on the cached rows.
+    """
+    version = cache.get(CHAMPION_STATS_VERSION_KEY, 0)
+    patches = resolve_patches(patch, window, version)
+    if not patches:
+        return patches, []
+    key = f"tier-list:{version}:{','.join(patches)}"
+    rows = cache.get(key)
+    if rows is None:
+        rows = _compute(patches)
+        cache.set(key, rows, timeout=TIER_LIST_TIMEOUT)
+    rows = sorted(rows, key=SORT_KEYS.get(sort, SORT_KEYS["win_rate"]), reverse=descending)
+    return patches, rows
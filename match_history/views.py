@@ -1,24 +1,33 @@
 import time
 
 from django.core.cache import cache
-from django.db.models import Prefetch
 from django.http import Http404, JsonResponse, HttpResponseBadRequest
 from django.shortcuts import render, get_object_or_404
 from django.template import RequestContext
 from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 
-from match_history.models import Participant, Match, AccountStats, SummonerChampionStats, ChampionStatsPatch
+from match_history.models import Participant, Match, AccountStats, SummonerChampionStats, ChampionStatsPatch, \
+    ParticipantCard, Champion
 from django.http import HttpResponse, HttpResponseRedirect
 from django.urls import reverse
 from match_history.util.populate_data import SummonerManager
+from match_history.util.summoner_lock import enqueue_for_summoner
+from match_history.util.profile_snapshot import get_profile_snapshot, get_profile_validators
+from match_history.util.teammates import top_teammates
+from match_history.util.keyset import keyset_page
+from match_history.util.card_fragments import render_match_cards
+from match_history.util.tier_list import get_tier_list, available_patches, SORT_KEYS
+from match_history.util.patch_provider import patch_provider
 from riotwatcher import ApiError
-from django.core.paginator import Paginator
-from collections import defaultdict
 from datetime import datetime
 from .tasks import *
 
-patch = "14.17"
+MAX_PATCH_WINDOW = 10
+MATCHES_PER_PAGE = 10
+RECENT_TEAMMATE_DAYS = 90
 
 
 def home(request):
@@ -81,8 +90,13 @@ def update(request):
 
     cache.set(cache_key, current_time, timeout=cooldown_duration)
 
-    task = update_matches.delay(summoner_id)
-    return JsonResponse({'task_id': task.id}, status=202)
+    # A parse already running for this summoner (from any session) is reported instead of starting another.
+    task_id, _ = enqueue_for_summoner(update_matches, summoner_id)
+    if task_id is None:
+        # Busy with a crawl, which has no progress to poll; the cooldown is lifted so the user can try again shortly.
+        cache.delete(cache_key)
+        return JsonResponse({'status': 'busy'}, status=409)
+    return JsonResponse({'task_id': task_id}, status=202)
 
 
 def details(request, game_name: str, tag: str):
@@ -93,6 +107,23 @@ def details(request, game_name: str, tag: str):
     except Http404 as e:
         raise Http404("This Page Does Not Exist")
 
+    # Every section is derived from data that moves the summoner's version stamp, so conditional requests are
+    # answered here, before any of the page's queries run.
+    etag, last_modified = get_profile_validators(summoner.puuid, summoner.being_parsed, summoner.task_id,
+                                                 request.GET.urlencode(), request.headers.get('x-requested-with'))
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    response = _details_response(request, summoner)
+    if response.status_code == 200:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _details_response(request, summoner):
     if summoner.being_parsed:
         context = {
             "task_id": summoner.task_id,
@@ -100,34 +131,34 @@ def details(request, game_name: str, tag: str):
         }
         return render(request, 'match_history/details.html', context)
 
-    matches_queryset = _get_match_queryset(summoner)
-    if matches_queryset is None:
-        raise Http404("This page does not exist.")
-    matches_per_page = 10
-    paginator = Paginator(matches_queryset, matches_per_page)
-    page_number = request.GET.get('page', 1)  #defaults to 1
-    page_obj = paginator.get_page(page_number)
-
-    summoner_champion_stats = _get_champions_queryset(summoner)
-    main_champ = summoner_champion_stats[0].champion if summoner_champion_stats else None
-
     if request.GET.get('section') == 'update' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return update_page(summoner)
-    elif request.GET.get('section') == 'paginate' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        if int(page_number) <= paginator.num_pages:
-            context = {"matches": _get_match_data(summoner, page_obj)}
-            return render(request, 'match_history/match_list.html', context)
-        else:
-            return HttpResponse(status=204)
 
-    context = {
-        "summoner": summoner,
-        "matches": _get_match_data(summoner, page_obj),
-        "account_stats": _get_account_stats(summoner),
-        "champion_stats": _get_champion_stats_data(summoner, summoner_champion_stats),
-        "recent_list": _get_recent(summoner),
-        "main_champ": main_champ,
-    }
+    cursor = request.GET.get('cursor')
+    if request.GET.get('section') == 'paginate' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        try:
+            matches, next_cursor = keyset_page(_get_card_queryset(summoner), cursor, MATCHES_PER_PAGE)
+        except ValueError:
+            return HttpResponse(status=400)
+        if not matches:
+            return HttpResponse(status=204)
+        context = {"matches": _get_match_data(summoner, matches), "next_cursor": next_cursor}
+        response = render(request, 'match_history/match_list.html', context)
+        if request.GET.get('count'):
+            # Only counted on request: it is the one query here whose cost grows with the history.
+            response['X-Total-Count'] = _get_card_queryset(summoner).count()
+        return response
+
+    if not cursor:
+        # The first page is served from the snapshot, which ingestion invalidates.
+        context = get_profile_snapshot(summoner.puuid, lambda: _get_profile_data(summoner))
+    else:
+        try:
+            context = _get_profile_data(summoner, cursor)
+        except ValueError:
+            raise Http404("This page does not exist.")
+    context["matches"] = _get_match_data(summoner, context.pop("cards"))
+    context["summoner"] = summoner
 
     return render(request, 'match_history/details.html', context)
 
@@ -152,8 +183,12 @@ def summoner(request):
         try:
             summonerBuilder = SummonerManager("americas", "na1")
             newSummoner = summonerBuilder.create_summoner(summoner_name, tag)
-            task = process_matches.delay(newSummoner.puuid)
-            newSummoner.task_id = task.task_id
+            task_id, _ = enqueue_for_summoner(process_matches, newSummoner.puuid)
+            if task_id:
+                newSummoner.task_id = task_id
+            else:
+                # A crawl is already backfilling them; show what is stored rather than a progress bar nothing feeds.
+                newSummoner.being_parsed = False
             newSummoner.save()
         except ApiError as e:
             print(f"{full_name}  ot found in db or Riot servers")
@@ -162,18 +197,32 @@ def summoner(request):
 
 
 def champions(request):
-    champion_query = ChampionStatsPatch.objects.filter(patch__iexact=patch).prefetch_related('champion')
-    champion_data = []
-
-    for champion_stat in champion_query:
-        champion_stat_tuple = (
-            champion_stat.patch,
-            champion_stat.total_played,
-            champion_stat.total_wins,
-            champion_stat.total_losses,
-        )
-        champion_data.append((champion_stat.champion.name, champion_stat_tuple))
-    context = {'champion_query': champion_data}
+    patch_param = request.GET.get('patch') or None
+    try:
+        window = min(max(int(request.GET.get('window', 1)), 1), MAX_PATCH_WINDOW)
+    except ValueError:
+        window = 1
+    sort = request.GET.get('sort', 'win_rate')
+    if sort not in SORT_KEYS:
+        sort = 'win_rate'
+    descending = request.GET.get('order', 'desc') != 'asc'
+
+    patches, rows = get_tier_list(patch_param, window, sort, descending)
+    asset_patch = patch_provider.current()
+    for row in rows:
+        row["image_url"] = Champion.url_for(row["image_path"], asset_patch)
+    context = {
+        'champion_query': rows,
+        'patches': patches,
+        'available_patches': available_patches(),
+        'selected_patch': patch_param or '',
+        'window': window,
+        'windows': [1, 3, 5],
+        'sort': sort,
+        'order': 'desc' if descending else 'asc',
+        'sort_columns': [('name', 'Champion'), ('win_rate', 'Win rate'), ('pick_rate', 'Pick rate'),
+                         ('games', 'Games'), ('confidence', 'Confidence')],
+    }
     return render(request, 'match_history/champions.html', context)
 
 
@@ -210,101 +259,35 @@ def _validate_summoner(game_name, tag):
     return summoner
 
 
-def _get_new_match_data(summoner):
-    matches_queryset = Match.objects.filter(participants__summoner=summoner, new_match=True).prefetch_related(
-        Prefetch('participants', queryset=Participant.objects.select_related(
-            'summoner', 'champion', "spell1", "spell2", "rune1", "rune2", "item1", "item2", "item3",
-            'item4', 'item5', 'item6', 'summoner__profile_icon'),
-                 to_attr='all_participants')
-    )
-    match_data = []
-
-    for match in matches_queryset:
-        blue_team_list = []
-        red_team_list = []
-        for participant in match.all_participants:
-            if participant.summoner == summoner:
-                main_participant = participant
-            if participant.team == 100:
-                blue_team_list.append(participant)
-            else:
-                red_team_list.append(participant)
+def _get_profile_data(summoner, cursor=None):
+    """Everything on the details page except the summoner itself, which is always read fresh."""
+    matches, next_cursor = keyset_page(_get_card_queryset(summoner), cursor, MATCHES_PER_PAGE)
+    summoner_champion_stats = _get_champions_queryset(summoner)
+    return {
+        # Rows rather than rendered cards: the relative match times must be filled in per response.
+        "cards": matches,
+        "next_cursor": next_cursor,
+        "account_stats": _get_account_stats(summoner),
+        "champion_stats": _get_champion_stats_data(summoner, summoner_champion_stats),
+        "recent_list": _get_recent(summoner),
+        "main_champ": summoner_champion_stats[0].champion if summoner_champion_stats else None,
+    }
 
-        kda = (
-                      main_participant.kills + main_participant.assists) / main_participant.deaths if main_participant.deaths else 0
-        cs_min = main_participant.creep_score / (match.game_duration / 60) if match.game_duration > 0 else 0
 
-        main_stats = {
-            "kda": f"{kda:.2f}",
-            "cs_min": f"{cs_min:.1f}"
-        }
-        match_data.append((match, main_participant, blue_team_list.copy(), red_team_list.copy(), main_stats))
-    matches_queryset.update(new_match=False)
+def _get_new_match_data(summoner):
+    cards = list(_get_card_queryset(summoner).filter(match__match__new_match=True)
+                 .order_by('-game_start', '-match_id'))
+    match_data = _get_match_data(summoner, cards)
+    Match.objects.filter(match_id__in=[card.match_id for card in cards]).update(new_match=False)
     return match_data
 
 
-def _get_match_data(summoner, page_obj):
-    match_data = []
-
-    for match in page_obj:
-        blue_team_list = []
-        red_team_list = []
-        for participant in match.all_participants:
-            if participant.summoner == summoner:
-                main_participant = participant
-            if participant.team == 100:
-                blue_team_list.append(participant)
-            else:
-                red_team_list.append(participant)
-
-        kda = (
-                      main_participant.kills + main_participant.assists) / main_participant.deaths if main_participant.deaths else 0
-        cs_min = main_participant.creep_score / (match.game_duration / 60) if match.game_duration > 0 else 0
-
-        main_stats = {
-            "kda": f"{kda:.2f}",
-            "cs_min": f"{cs_min:.1f}"
-        }
-        match_data.append((match, main_participant, blue_team_list.copy(), red_team_list.copy(), main_stats))
-    return match_data
+def _get_match_data(summoner, cards):
+    return render_match_cards(cards)
 
 
 def _get_recent(summoner):
-    matches_queryset = _get_match_queryset(summoner)
-    counter = defaultdict(lambda: {'count': 0, 'wins': 0})
-    matches = matches_queryset[:50]
-    games_played = len(matches)
-    main_team = None
-    for match in matches:
-        for participant in match.all_participants:
-            if participant.summoner == summoner:
-                main_team = participant.team
-                break;
-
-        for participant in match.all_participants:
-            if participant.team != main_team or participant.summoner == summoner:
-                continue
-            if participant.win:
-                counter[participant.summoner]['wins'] += 1
-            counter[participant.summoner]['count'] += 1
-    recent_sorted = sorted(counter.items(), key=lambda item: item[1]['count'], reverse=True)[:7]
-
-    recent_stats = []
-    for participant in recent_sorted:
-        total_played = participant[1]['count']
-        if total_played == 1:
-            continue
-        total_wins = participant[1]['wins']
-        total_loses = total_played - total_wins
-        win_rate = (total_wins / total_played * 100) if total_played > 0 else 0
-        stats = {
-            'participant': participant[0],
-            'total_wins': participant[1]['wins'],
-            'total_losses': total_loses,
-            'winrate': int(round(win_rate)),
-        }
-        recent_stats.append(stats)
-    return games_played, recent_stats
+    return RECENT_TEAMMATE_DAYS, top_teammates(summoner, limit=7, days=RECENT_TEAMMATE_DAYS)
 
 
 def _get_champion_stats_data(summoner, summoner_champion_stats):
@@ -358,14 +341,8 @@ def _get_account_stats(summoner):
     return stats
 
 
-def _get_match_queryset(summoner):
-    matches_queryset = Match.objects.filter(participants__summoner=summoner).prefetch_related(
-        Prefetch('participants', queryset=Participant.objects.select_related(
-            'summoner', 'champion', "spell1", "spell2", "rune1", "rune2", "item1", "item2", "item3",
-            'item4', 'item5', 'item6', 'summoner__profile_icon'),
-                 to_attr='all_participants')
-    )
-    return matches_queryset
+def _get_card_queryset(summoner):
+    return ParticipantCard.objects.filter(summoner=summoner).select_related('match')
 
 
 def _get_champions_queryset(summoner):